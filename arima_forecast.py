@@ -0,0 +1,40 @@
+import time
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+
+ARIMA_REFIT = 100 # Days between refits of expanding window ARIMA
+
+
+def expandingForecast(history, actual, order, refit_every=ARIMA_REFIT):
+  """
+  One day ahead ARIMA forecasts of actual days with the history growing by
+  one actual day per step. ARIMA is fitted once, then its results are
+  extended with every new day at fixed parameters and refitted every
+  refit_every days (None never refits). Start parameters of ARIMA are cheap
+  to estimate, warm starts made refits slower.
+  Returns DataFrame of 'day', 'prediction', 'actual', 'error', 'refit' and
+  'seconds' per step.
+  """
+  history = list(history)
+  model_fit = ARIMA(history, order=order).fit()
+  n_days = len(actual)
+  result = {'day': np.arange(n_days),
+            'prediction': np.zeros(n_days),
+            'actual': np.asarray(actual, dtype=np.float64),
+            'refit': np.zeros(n_days, dtype=bool),
+            'seconds': np.zeros(n_days)}
+
+  for day, y_act in enumerate(actual):
+    start = time.perf_counter()
+    if refit_every and day > 0 and day % refit_every == 0:
+      model_fit = ARIMA(history, order=order).fit()
+      result['refit'][day] = True
+    result['prediction'][day] = model_fit.forecast()[0]
+    history.append(y_act)
+    model_fit = model_fit.extend([y_act])
+    result['seconds'][day] = time.perf_counter() - start
+
+  result['error'] = result['actual'] - result['prediction']
+  return pd.DataFrame(result)[['day', 'prediction', 'actual', 'error', 'refit',
+                               'seconds']]
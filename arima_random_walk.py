@@ -16,6 +16,7 @@ from datetime import date
 from datetime import datetime
 
 from itertools import product
+from arima_forecast import expandingForecast
 
 
 def computeReturns(prices):
@@ -69,17 +70,14 @@ residuals = pd.DataFrame(model_fit.resid)
 print(residuals.describe())
 
 
-history     = train.copy()
-predictions = []
-for day in range(len(test)):
-  model = ARIMA(history, order=(1, 1, 0))
-  model_fit = model.fit()
-  output = model_fit.forecast()
-  y_hat  = output[0]
-  y_act  = test[day]
-  predictions.append(y_hat)
-  history.append(y_act)
+# ARIMA is fitted once and only updated with every test day, parameters are
+# refitted every REFIT_EVERY days
+REFIT_EVERY = 100
+steps = expandingForecast(train, test, (1, 1, 0), REFIT_EVERY)
+predictions = steps['prediction'].tolist()
+print('Refits = {}, mean step time = {:.4f} s'.format(
+  steps['refit'].sum(), steps['seconds'].mean()))
 
 
 rmse = sqrt(mean_squared_error(test, predictions))
-print('Mean squared error = {:.2f}'.format(rmse))
\ No newline at end of file
+print('Mean squared error = {:.2f}'.format(rmse))
@@ -10,7 +10,14 @@ Original file is located at
 import random
 import numpy as np
 import pandas as pd
-import yfinance as yf
+import market_data
+from backtest import BUY
+from backtest import SELL
+from backtest import HOLD
+from backtest import tradeLedger
+from walk_forward import startWalk
+from walk_forward import stepWalk
+from outliers import removeOutliers
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
 
@@ -55,7 +62,7 @@ warnings.filterwarnings('ignore', message="Values in x were outside bounds durin
 def readYfData(idx):
   start_date = datetime(2016, 1, 1)
   end_date   = date.today()
-  etf_df = yf.download(idx, start=start_date, end=end_date)
+  etf_df = market_data.read_history(idx, start_date, end_date)
   return etf_df
 
 def computeReturns(prices):
@@ -65,131 +72,6 @@ def computeReturns(prices):
   returns = [0.00000] + returns
   return returns
 
-def removeOutliers(returns, sigma_limit):
-  scaler = StandardScaler()
-  scaled_log_returns = scaler.fit_transform(np.array(returns).reshape(-1, 1))
-  scaled_outliers = [i for i, x in enumerate(scaled_log_returns)\
-                     if abs(x) > sigma_limit]
-  rep = np.median(returns)
-  log_returns = [rep if i in scaled_outliers else x for\
-                 i, x in enumerate(returns)]
-  return log_returns
-
-def computeEpsilon(c, phi, theta, r):
-  """
-  This function computes epsilon for using the formula for an ARMA(p, q) process
-  with intercept and returns an array of epsilons.
-  c - coefficient of intercept
-  phi - list of phi coefficients of length p
-  theta - list of theta coefficients of length q
-  r - an array of returns
-  """
-  T = len(r)
-  eps = np.zeros(T)
-  for t in range(T):
-    if t < len(phi):
-      eps[t] = r[t] - np.mean(r)
-    else:
-      ar_part = np.sum(np.array([phi[i] * r[t - 1 - i] for i in range(len(phi))], dtype=np.float64))
-      ma_part = np.sum(np.array([theta[i] * eps[t - 1- i] for i in range(len(theta))], dtype=np.float64))
-      eps[t]  = r[t] - c - ar_part - ma_part
-  return eps
-
-def getSigma2(omega, alpha, beta, gamma, r, eps):
-  T = len(eps)
-  sigma2 = np.zeros(T)
-  if (1 - alpha - beta) == 0:
-    sigma2[0] = omega / (1 - 0.9999999999999998)
-  else:
-    sigma2[0] = omega / (1 - alpha - beta)
-  for t in range(1, T):
-    sigma2[t] = omega + alpha * eps[t - 1] ** 2 + beta * sigma2[t - 1]
-  return sigma2
-
-def llhNormal(params, p, q, r):
-  # We need constant, phi and theta for epsilon estimation in ARMA process
-  c     = params[0]
-  phi   = params[1:p+1]
-  theta = params[p+1:p+q+1]
-  # We need omega, alpha and beta params for GARCH process
-  omega, alpha, beta = params[-3:]
-  gamma = None
-  et = computeEpsilon(c, phi, theta, r)
-  sigma2 = getSigma2(omega, alpha, beta, gamma, r, et)
-  if any(sigma2 < 0):
-    sigma2[sigma2 < 0] = -1 * sigma2[sigma2 < 0]
-  llh    = -0.5 * (np.log(2*np.pi) + np.log(sigma2) + et**2 / (2*sigma2))
-  neg_llh   = -llh
-  total_llh = np.sum(neg_llh)
-  return total_llh
-
-def cons0(params, p, q, r):
-  alpha, beta = params[-2:]
-  return 1.0 - np.finfo(np.float64).eps - alpha - beta
-
-def cons1(params, p, q, r):
-  return 1.0 - np.sum(params[1:p+1]) - np.finfo(np.float64).eps
-
-def trainModel(r, p, q):
-  np.seterr(divide='ignore', invalid='ignore', over='ignore')
-  e = np.finfo(np.float64).eps
-  bounds = [(-10*np.abs(np.mean(r)), 10*np.abs(np.mean(r)))] + \
-           [(-0.999999, 0.999999) for _ in range(p + q)] + \
-           [(e, 2 * np.var(r))]
-  alpha_bounds, beta_bounds = [(e, 1.0 - e) for _ in range(2)]
-  initial_params = [0.001 for _ in range(p + q + 1)]
-  initial_params = initial_params + [0.001, 0.1, 0.8]
-  bounds = bounds + [alpha_bounds, beta_bounds]
-  min_func = llhNormal
-  eqcons   = []
-  ieqcons  = [cons0, cons1]
-  result = optimize.fmin_slsqp(func = min_func,
-                               x0   = initial_params,
-                               ieqcons = ieqcons,
-                               eqcons  = eqcons,
-                               bounds  = bounds,
-                               epsilon = 1e-6,
-                               acc     = 1e-7,
-                               full_output = True,
-                               iprint  = 0,
-                               args    = (p, q, r),
-                               iter    = 300)
-  return result
-
-def simultaneousLlh(r, max_p, max_q):
-  orders   = list(product(np.arange(max_p + 1), np.arange(max_q + 1)))
-  best_aic = np.inf
-  for order in orders:
-    p = order[0]
-    q = order[1]
-    result = trainModel(r, p, q)
-    current_aic = 2 * result[1] + 2 * len(result[0])
-    if current_aic < best_aic:
-      best_aic = current_aic
-      best_p, best_q = p, q
-      best_params = result[0]
-  return best_p, best_q
-
-def trainArma(r, p, q):
-  arima_model = sm.tsa.statespace.SARIMAX(r,
-                                          trend = 'c',
-                                          order = (p, 0, q),
-                                          enforce_stationarity=False,
-                                          enforce_invertibility=False)
-  arima_result = arima_model.fit(disp=False)
-  arima_resids = arima_result.resid
-  return arima_result, arima_resids
-
-def trainGarch(scaled_traning):
-  archm = arch_model(scaled_training,
-                     mean = 'zero',
-                     vol  = 'garch',
-                     p    = 1,
-                     q    = 1,
-                     dist = 'Normal')
-  gjr = archm.fit(update_freq=100, disp=False)
-  return gjr
-
 def predictArma(arima_result, look_ahead, r):
   predicted_mu = arima_result.forecast(steps=look_ahead).tolist()
   q25 = np.quantile(r, 0.25)
@@ -246,6 +128,7 @@ LOOK_BACK   =  365        # Number of days to look back when building a model
 LOOK_AHEAD  =    1        # Number of days to forecast ahead
 BURN_IN     =   30        # Burn in period to allow RSI to stabilize
 OUTLIER_SIG =  3.3        # Outlier sigma to cut-off outliers
+OUTLIER_WIN = None        # Days of causal outlier stats, None uses all days
 INITIAL_INV = 1000        # Initial investment amount
 TRANS_COST  =    8        # Cost per one transaction
 IDLE_COST   =  120        # Cost if now transactions in 365 days
@@ -264,33 +147,32 @@ highs = iuit_l['High']
 # We use standardized log returns to detect outliers since other methods like
 # IQR are too sensitive to outliers and identify too many of them in the series
 # which might lead to loosing some valuable information.
-returns = removeOutliers(returns, OUTLIER_SIG)
+returns = removeOutliers(returns, OUTLIER_SIG, window=OUTLIER_WIN)
 n_steps  = len(returns) - (ENTRY_IDX + LOOK_AHEAD)
 last_idx = len(returns) + 1 - LOOK_AHEAD
 
 steps = 0
 
-cash_history = []
-invt_history = []
+actions = []
 
 testing_history = []
 forecast_history = []
 volatility_history = []
 
-cash = INITIAL_INV
-inventory = 0
+# Order search and refits run on a schedule, the model is only updated with
+# the new day in between
+walk = startWalk(MAX_P, MAX_Q)
 
 for step in range(ENTRY_IDX, last_idx):
   window_ret = returns[step - LOOK_BACK:step + LOOK_AHEAD]
   training   = window_ret[:LOOK_BACK]
   testing    = window_ret[LOOK_BACK:]
 
-  p, q = simultaneousLlh(training, MAX_P, MAX_Q)
-  arima_result, arima_resids = trainArma(training, p, q)
-
-  scaler = StandardScaler()
-  scaled_training = scaler.fit_transform(np.array(arima_resids).reshape(-1, 1))
-  gjr = trainGarch(scaled_training)
+  fit  = stepWalk(walk, training)
+  p, q = fit['order']
+  arima_result = fit['arma']
+  scaler = fit['scaler']
+  gjr    = fit['garch']
 
   predicted_mu = predictArma(arima_result, len(testing), training)
   predicted_et = gjr.forecast(horizon=len(testing)).variance
@@ -307,24 +189,12 @@ for step in range(ENTRY_IDX, last_idx):
   tomorrow_price = today_price * (1 + y_hat[0])
 
   if today_price < tomorrow_price:
-    affordable_qty = floor((cash - TRANS_COST) / today_price)
-    if  affordable_qty >= MIN_PURCHAS:
-      inventory += affordable_qty
-      cash -= ((today_price * affordable_qty) + TRANS_COST)
+    actions.append(BUY)
   elif today_price > tomorrow_price:
-    # we do not need additional conditions since inventory cannot be less than
-    # the minimal purchase
-    if inventory > 0:
-      cash += inventory * today_price
-      inventory = 0
-
-  if step == last_idx - 1:
-    if inventory > 0:
-      cash += inventory * today_price
-      inventory = 0
-
-  cash_history.append(cash)
-  invt_history.append(inventory)
+    actions.append(SELL)
+  else:
+    actions.append(HOLD)
+
   testing_history.extend(testing)
   forecast_history.extend(y_hat)
   volatility_history.extend(volatil_fc)
@@ -332,7 +202,18 @@ for step in range(ENTRY_IDX, last_idx):
   steps += 1
 
   if steps % 10 == 0:
-    print('Processed steps = {}'.format(steps))
+    print('Processed steps = {}, order searches = {}, refits = {}'.format(
+      steps, walk['selects'], walk['refits']))
 
   #if steps == 10:
-  #  break
\ No newline at end of file
+  #  break
+
+# Forecasts do not depend on cash, so trades of all steps run in one pass of
+# the ledger. Buys keep cash for the cost, sells are free and the last step
+# sells whatever is left.
+traded = prices[ENTRY_IDX:ENTRY_IDX + len(actions)]
+ledger = tradeLedger(traded, actions, INITIAL_INV, TRANS_COST, MIN_PURCHAS,
+                     exit='after', cost_on_sell=False, cents=False, record=True)
+cash = ledger['cash']
+cash_history = ledger['history']['cash'].tolist()
+invt_history = ledger['history']['stock'].tolist()
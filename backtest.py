@@ -0,0 +1,176 @@
+import numpy as np
+from math import floor
+
+HOLD = 0
+BUY  = 1
+SELL = 2
+ACTION_CODES = {'hold': HOLD, 'buy': BUY, 'sell': SELL}
+
+# One row per executed trade of tradeLedger, cash and stock after the trade
+FILL = np.dtype([('day', '<i8'), ('action', 'i1'), ('price', '<f8'),
+                 ('qty', '<f8'), ('amount', '<f8'), ('cost', '<f8'),
+                 ('cash', '<f8'), ('stock', '<f8')])
+
+
+def roundCents(values):
+  """
+  Round array to cents exactly as round(value, 2) does. np.round scales by
+  100 first and can resolve values close to a half cent the other way, so
+  those few are rounded one by one.
+  """
+  values = np.asarray(values, dtype=np.float64)
+  scaled = values * 100
+  result = np.round(scaled) / 100
+  near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+  if near_half.any():
+    result[near_half] = [round(float(value), 2) for value in values[near_half]]
+  return result
+
+def actionCodes(rsi, oversold, overbought):
+  """Codes of RSI: BUY at or below oversold, SELL at or above overbought"""
+  rsi = np.asarray(rsi)
+  return np.where(rsi <= oversold, BUY,
+                  np.where(rsi >= overbought, SELL, HOLD)).astype(np.int8)
+
+def codesFromActions(actions):
+  """Array of action codes of a list of 'buy', 'sell' and 'hold' actions"""
+  return np.array([ACTION_CODES[action] for action in actions], dtype=np.int8)
+
+def tradeLedger(prices, actions, budget, cost, k=1, entry=None, exit=None,
+                cost_in_cash=True, cost_on_sell=True, cents=True, record=False):
+  """
+  Trade one strategy in a single pass over aligned arrays of prices and
+  action codes, visiting only days with a buy or sell signal. Buys take the
+  floor quantity cash affords, sells close the whole position.
+  prices  -- array of prices
+  actions -- array of HOLD, BUY, SELL codes, one per price
+  budget  -- initial investment
+  cost    -- cost of 1 transaction
+  k       -- minimum n of items in a trade, smaller trades are skipped
+  entry   -- day of forced buy, earlier days are skipped, None trades from day 0
+  exit    -- None keeps the stock at the end, 'force' turns the last day into a
+             sell, 'after' sells leftover stock after the action of the last
+             day
+  cost_in_cash -- pay costs from cash and keep cash for the cost when buying,
+                  otherwise costs are summed aside and deducted from profit
+  cost_on_sell -- charge the cost on sells too
+  cents   -- round trade amounts to cents
+  record  -- also return per day arrays of 'cash' and 'stock' in history
+  Returns dict of 'fills' (FILL array), 'cash', 'stock', total 'cost',
+  'profit', 'margin' and 'history' (None unless record).
+  """
+  prices = np.asarray(prices, dtype=np.float64)
+  signal = np.array(actions, dtype=np.int8)
+  n_days = len(prices)
+  start  = 0 if entry is None else entry
+  signal[:start] = HOLD
+  if exit == 'force' and start < n_days:
+    signal[-1] = SELL
+  if entry is not None and entry < n_days:
+    signal[entry] = BUY
+
+  cash  = float(budget)
+  stock = 0
+  costs = 0.0
+  fills = []
+
+  def fill(day, action, price, qty):
+    nonlocal cash, stock, costs
+    amount = round(qty * price, 2) if cents else qty * price
+    charge = cost if action == BUY or cost_on_sell else 0
+    paid   = charge if cost_in_cash else 0
+    costs += charge
+    if action == BUY:
+      cash  -= amount + paid
+      stock += qty
+    else:
+      cash  += amount - paid
+      stock  = 0
+    fills.append((day, action, price, qty, amount, charge, cash, stock))
+
+  price_list = prices.tolist()
+  for day in np.flatnonzero(signal != HOLD).tolist():
+    price = price_list[day]
+    if signal[day] == BUY:
+      can_spend = cash - cost if cost_in_cash else cash
+      can_buy   = floor(can_spend / price)
+      if can_buy >= k and can_buy > 0:
+        fill(day, BUY, price, can_buy)
+    elif stock >= k and stock > 0:
+      fill(day, SELL, price, stock)
+  if exit == 'after' and stock > 0 and start < n_days:
+    fill(n_days - 1, SELL, price_list[-1], stock)
+
+  fills  = np.array(fills, dtype=FILL)
+  profit = cash - budget - (0 if cost_in_cash else costs)
+  history = None
+  if record:
+    # State at the end of a day is the one after its last fill
+    pos = np.searchsorted(fills['day'], np.arange(n_days), side='right')
+    history = {'cash': np.concatenate([[budget], fills['cash']])[pos],
+               'stock': np.concatenate([[0.0], fills['stock']])[pos]}
+    history['cash'][:start]  = np.nan
+    history['stock'][:start] = np.nan
+  return {'fills': fills, 'cash': cash, 'stock': stock, 'cost': costs,
+          'profit': profit, 'margin': profit / budget, 'history': history}
+
+def batchTrade(prices, actions, budget, cost, entry, k, record=False):
+  """
+  Evaluate many strategies over the same prices at once with the fill rules
+  of tradeLedger with exit='force': forced buy at entry, forced sell on the
+  last day, buy of floor quantity that leaves cash for the cost, trades below
+  k items skipped.
+  prices  -- array of prices of length days
+  actions -- (strategies x days) array of HOLD, BUY, SELL codes
+  budget  -- initial investment
+  cost, entry, k -- scalars or arrays with a value per strategy
+  record  -- also return per day (strategies x days) arrays of 'signal',
+             'stock' and 'cash', filled from entry of every strategy
+  Returns array of cash at exit per strategy and history dict or None.
+  """
+  prices  = np.asarray(prices, dtype=np.float64)
+  actions = np.atleast_2d(actions)
+  n_strat, n_days = actions.shape
+  cost  = np.broadcast_to(np.asarray(cost, dtype=np.float64), (n_strat,))
+  entry = np.broadcast_to(np.asarray(entry), (n_strat,))
+  k     = np.broadcast_to(np.asarray(k), (n_strat,))
+
+  # Apply forced and skipped days once, keep one contiguous row per day
+  active = np.arange(n_days) >= entry[:, None]
+  signal = np.where(active, actions, HOLD).astype(np.int8)
+  signal[:, -1] = np.where(active[:, -1], SELL, HOLD)
+  signal[np.arange(n_strat), np.minimum(entry, n_days - 1)] = BUY
+  signal[entry >= n_days] = HOLD
+  signal = np.ascontiguousarray(signal.T)
+
+  cash  = np.full(n_strat, float(budget))
+  stock = np.zeros(n_strat)
+  memory = None
+  if record:
+    memory = {'signal': signal.T.copy(),
+              'stock': np.full((n_strat, n_days), np.nan),
+              'cash': np.full((n_strat, n_days), np.nan)}
+
+  for i in range(int(entry.min()) if n_strat else n_days, n_days):
+    price = prices[i]
+    buy = np.flatnonzero(signal[i] == BUY)
+    if len(buy):
+      can_buy = np.floor((cash[buy] - cost[buy]) / price)
+      enough  = can_buy >= k[buy]
+      buy, can_buy = buy[enough], can_buy[enough]
+      cash[buy]  -= roundCents(can_buy * price) + cost[buy]
+      stock[buy] += can_buy
+
+    sell = np.flatnonzero(signal[i] == SELL)
+    if len(sell):
+      sell = sell[stock[sell] >= k[sell]]
+      cash[sell] += roundCents(stock[sell] * price) - cost[sell]
+      stock[sell] = 0
+
+    if record:
+      memory['stock'][:, i] = stock
+      memory['cash'][:, i]  = cash
+  if record:
+    memory['stock'][~active] = np.nan
+    memory['cash'][~active]  = np.nan
+  return roundCents(cash), memory
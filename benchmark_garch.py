@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+
+# Compare ARMA-GARCH fits of trainModel with finite difference and exact
+# gradients on the IUIT.L window used by arma_garch_volatility: number of
+# likelihood and gradient evaluations, wall time and AIC of every order.
+#
+#   python benchmark_garch.py [folder with IUIT.L.csv]
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+import market_data
+import garch_model
+from datetime import datetime
+from itertools import product
+from indicators import computeReturns
+
+TICKER    = 'IUIT.L'
+START     = datetime(2016, 1, 1)
+ENTRY_IDX = 1489 # Index of 19-11-2021 when we started trading
+LOOK_BACK = 365
+MAX_P     = 3
+MAX_Q     = 3
+REPEATS   = 5
+
+COUNTS = {'llh': 0, 'gradient': 0}
+
+
+def counted(func, key):
+  def wrapper(*args):
+    COUNTS[key] += 1
+    return func(*args)
+  return wrapper
+
+def readWindow(source=None):
+  bars = market_data.read_history(TICKER, START, source=source)
+  log_prices = np.log(bars['Close'].to_numpy()).tolist()
+  returns = computeReturns(log_prices)
+  entry = min(ENTRY_IDX, len(returns))
+  return returns[entry - LOOK_BACK:entry]
+
+def benchmark(r, gradient):
+  rows = []
+  for p, q in product(range(MAX_P + 1), range(MAX_Q + 1)):
+    COUNTS['llh'] = COUNTS['gradient'] = 0
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+      result = garch_model.trainModel(r, p, q, gradient=gradient)
+    elapsed = (time.perf_counter() - start) / REPEATS
+    rows.append({'p': p,
+                 'q': q,
+                 'llh evals': COUNTS['llh'] // REPEATS,
+                 'grad evals': COUNTS['gradient'] // REPEATS,
+                 'iterations': result[2],
+                 'aic': 2 * result[1] + 2 * len(result[0]),
+                 'ms': 1000 * elapsed})
+  return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+  source = market_data.csv_source(sys.argv[1]) if len(sys.argv) > 1 else None
+  r = readWindow(source)
+  garch_model.llhNormal   = counted(garch_model.llhNormal, 'llh')
+  garch_model.llhGradient = counted(garch_model.llhGradient, 'gradient')
+
+  numeric = benchmark(r, gradient=False)
+  exact   = benchmark(r, gradient=True)
+  table = numeric.merge(exact, on=['p', 'q'], suffixes=(' numeric', ' exact'))
+  print(table.round(2).to_string(index=False))
+  print('Window of {} returns, mean of {} runs per fit'.format(len(r), REPEATS))
+  for name, frame in (('numeric', numeric), ('exact', exact)):
+    print('{:8} llh evals = {:5d}, grad evals = {:4d}, time = {:8.1f} ms'.format(
+      name, frame['llh evals'].sum(), frame['grad evals'].sum(), frame['ms'].sum()))
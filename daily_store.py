@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+import os
+import numpy as np
+import history
+from contextlib import contextmanager
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# File is a 16 byte header followed by fixed width (date, return) records kept
+# in date order. A record is only ever appended or overwritten in place, so a
+# cron job killed mid-write leaves at most a partial last record, which readers
+# skip and the next writer cuts off.
+MAGIC  = b'NESTEGG\x01'
+RECORD = np.dtype([('date', '<M8[D]'), ('ret', '<f8')])
+HEADER = np.dtype([('magic', 'S8'), ('itemsize', '<i8')])
+
+
+def to_day(day):
+  return np.datetime64(day, 'D')
+
+
+def create_store(path):
+  '''Create empty store unless it already exists'''
+  if os.path.exists(path):
+    return
+  header = np.array([(MAGIC, RECORD.itemsize)], dtype=HEADER)
+  temp = path + '.{}.tmp'.format(os.getpid())
+  with open(temp, 'wb') as out_file:
+    out_file.write(header.tobytes())
+  os.replace(temp, path)
+
+
+def check_header(path):
+  header = np.fromfile(path, dtype=HEADER, count=1)
+  if len(header) != 1 or header['magic'][0] != MAGIC or \
+     header['itemsize'][0] != RECORD.itemsize:
+    raise ValueError('{} is not a daily history store'.format(path))
+
+
+def count_records(path):
+  return (os.path.getsize(path) - HEADER.itemsize) // RECORD.itemsize
+
+
+def load_store(path, mode='r'):
+  '''Map complete records of store as structured (date, ret) array'''
+  check_header(path)
+  n_records = count_records(path)
+  if n_records == 0:
+    return np.zeros(0, dtype=RECORD)
+  return np.memmap(path, dtype=RECORD, mode=mode, offset=HEADER.itemsize,
+                   shape=(n_records,))
+
+
+def load_returns(path):
+  '''Return zero-copy view of decimal returns in date order'''
+  return load_store(path)['ret']
+
+
+def last_date(path):
+  records = load_store(path)
+  if len(records) == 0:
+    return None
+  return records['date'][-1]
+
+
+def missing_range(path, today):
+  '''Return (start, end) days without history before today or None'''
+  last = last_date(path)
+  end  = to_day(today)
+  if last is None or last + 1 >= end:
+    return None
+  return last + 1, end
+
+
+@contextmanager
+def store_lock(path):
+  '''Hold exclusive lock of the store for the time of a write'''
+  with open(path + '.lock', 'a') as lock_file:
+    if fcntl is not None:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def upsert(path, days, returns):
+  '''
+  Write (day, decimal return) records to store. Days already in store are
+  overwritten in place, days after the last record are appended, so running
+  the same update twice is harmless. An older missing day is rare (manual
+  backfill of a gap) and rewrites the file once.
+  '''
+  create_store(path)
+  new = np.zeros(len(days), dtype=RECORD)
+  new['date'] = [to_day(day) for day in days]
+  new['ret']  = returns
+  # Keep the last value given for a day
+  order = np.argsort(new['date'], kind='stable')
+  new = new[order]
+  keep = np.ones(len(new), dtype=bool)
+  keep[:-1] = new['date'][:-1] != new['date'][1:]
+  new = new[keep]
+
+  with store_lock(path):
+    check_header(path)
+    n_records = count_records(path)
+    size = HEADER.itemsize + n_records * RECORD.itemsize
+    if os.path.getsize(path) != size:
+      os.truncate(path, size)
+
+    records = load_store(path, mode='r+')
+    pos = np.searchsorted(records['date'], new['date'])
+    found = pos < len(records)
+    found[found] = records['date'][pos[found]] == new['date'][found]
+    if found.any():
+      records['ret'][pos[found]] = new['ret'][found]
+      records.flush()
+    del records
+
+    new = new[~found]
+    if len(new) == 0:
+      return
+    if n_records and new['date'][0] <= last_date(path):
+      rewrite(path, new)
+    else:
+      with open(path, 'ab') as out_file:
+        out_file.write(new.tobytes())
+        out_file.flush()
+        os.fsync(out_file.fileno())
+
+
+def rewrite(path, new):
+  records = np.concatenate([np.array(load_store(path)), new])
+  records = records[np.argsort(records['date'], kind='stable')]
+  header  = np.array([(MAGIC, RECORD.itemsize)], dtype=HEADER)
+  temp = path + '.{}.tmp'.format(os.getpid())
+  with open(temp, 'wb') as out_file:
+    out_file.write(header.tobytes())
+    out_file.write(records.tobytes())
+    out_file.flush()
+    os.fsync(out_file.fileno())
+  os.replace(temp, path)
+
+
+def import_text(path, text_file, last_day):
+  '''
+  Seed store from undated text history in percent. Text file has one return
+  per trading day and no dates, so days are assigned as consecutive business
+  days ending on last_day, the day of the last return in the file. Dates of
+  old records are approximate for that reason.
+  '''
+  returns = history.load_returns(text_file)
+  last_day = np.busday_offset(to_day(last_day), 0, roll='backward')
+  days = np.busday_offset(last_day, np.arange(1 - len(returns), 1))
+  upsert(path, days, returns)
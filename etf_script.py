@@ -1,10 +1,13 @@
 #!/usr/bin/python3
 
+import os
 import time
 import sys
-import random
 import numpy as np
-import yfinance as yf
+import mc_engine
+import mc_stats
+import daily_store
+import market_data
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
@@ -14,6 +17,14 @@ START_VALUE = 1000
 MIN_HOLD = 60
 MAX_HOLD = 365
 CUT_OFF_DATE = date(2024, 4, 13)
+TRUNCATE     = False # Cut value to whole units daily as legacy loop did
+RISK_LEVEL    = 0.95  # Confidence of earnings at risk
+OUTCOME_RANGE = 4     # Outcomes up to this multiple of start value are binned
+ODDS_WIDTH    = 0.005 # Stop when ruin odds are known within this either side
+MEAN_WIDTH    = 0.005 # Same for mean outcome, relative to the mean
+HISTORY_STORE = 'etf_returns.bin' # Dated store of daily returns
+HISTORY_TEXT  = 'etf_returns.txt' # Undated text history to seed the store
+HISTORY_END   = date(2023, 7, 26) # Day of the last return in HISTORY_TEXT
 
 
 def compute_median_hold(cut_off_date):
@@ -24,98 +35,84 @@ def compute_median_hold(cut_off_date):
   median_hold = cut_off_date - today
   return median_hold.days
 
-def read_to_list(file_name):
-  '''Read history of returns and convert to decimal'''
-  with open(file_name) as in_file:
-    lines   = [float(line.strip()) for line in in_file]
-    decimal = [round(line / 100, 5) for line in lines]
-    return decimal
-
-def read_yesterday(today):
-  '''Return yesterday history or zero if no history in pct'''
-  t1 = today
-  t2 = today - timedelta(days = 2)
-  ticker = yf.download('IUIT.L', start=t2, end=t1)['Adj Close'].to_numpy()
-  if len(ticker) == 2:
-    return round(100 * (ticker[1] - ticker[0]) / ticker[0], 5)
-  else:
-    return 0.0
-
-def montecarlo(returns, median_hold):
+def read_missing(start, end):
+  '''Return trading days from start up to end and their decimal returns'''
+  start = start.astype(date)
+  end   = end.astype(date)
+  # Take a few days before start to have previous close for the first return
+  ticker = market_data.read_history('IUIT.L', start - timedelta(days = 7), end)
+  prices = ticker['Adj Close']
+  pct    = (100 * prices.pct_change()).round(5)
+  pct    = pct[pct.index.date >= start].dropna()
+  days   = pct.index.date.tolist()
+  decimal = [round(i / 100, 5) for i in pct.tolist()]
+  return days, decimal
+
+def update_history(today):
+  '''Add returns of days missing from history store up to yesterday'''
+  if not os.path.exists(HISTORY_STORE):
+    daily_store.import_text(HISTORY_STORE, HISTORY_TEXT, HISTORY_END)
+  missing = daily_store.missing_range(HISTORY_STORE, today)
+  if missing is not None:
+    days, decimal = read_missing(*missing)
+    daily_store.upsert(HISTORY_STORE, days, decimal)
+  return daily_store.load_returns(HISTORY_STORE)
+
+def montecarlo(returns, median_hold, truncate=TRUNCATE):
   '''Run Monte Carlo Simulation'''
-  case_count = 0
   # Bankrupt here means final investment < initial investment. We do not use
   # NPV since deposit yield is 0.03% p.a. which makes alternative investment
   # useless
-  bankrupt_count = 0
-  outcome = []
-  
-  while case_count < int(NUM_CASES):
-    investments = START_VALUE
-    start_day = random.randrange(0, len(returns))
-    duration  = int(random.triangular(MIN_HOLD, MAX_HOLD, int(median_hold)))
-    end_day   = start_day + duration
-    lifespan  = [i for i in range(start_day, end_day)]
-    bankrupt  = 'no'
-
-    lifespan_returns = []
-    for i in lifespan:
-      lifespan_returns.append(returns[i % len(returns)])
-    
-    for index, i in enumerate(lifespan_returns):
-      investments = int(investments * (1 + i))
-
-    if investments < START_VALUE:
-      bankrupt = 'yes'
-      bankrupt_count += 1
-
-    outcome.append(investments)
-    case_count += 1
-  
-  return outcome, bankrupt_count 
-
+  return mc_engine.hold_stats(returns, START_VALUE, MIN_HOLD, MAX_HOLD,
+                              int(median_hold), NUM_CASES, OUTCOME_RANGE,
+                              truncate, ODDS_WIDTH, MEAN_WIDTH)
 
-def bankrupt_prob(outcome, bankrupt_count, median_hold):
-  total = len(outcome)
-  odds  = round(100 * bankrupt_count / total, 1)
 
-  min_out = min(i for i in outcome)
-  avg_out = int(sum(outcome) / total)
-  max_out = max(i for i in outcome)
+def bankrupt_prob(stats, median_hold):
+  result = mc_stats.summary(stats)
+  odds = result['odds']
 
-  # Reverse loss and gain to be able to apply the computation of 0.95 quantile
-  # and find critical range and the 95% probability that a loss will not exceed
-  # certain amount
-  reverse_outcome = [i - START_VALUE for i in outcome]
-  reverse_outcome = [-1 * i for i in reverse_outcome]
-  reverse_outcome.sort()
-  q95 = int(NUM_CASES * 0.95)
-  loss = reverse_outcome[q95]
+  min_out = int(result['min'])
+  avg_out = int(result['mean'])
+  max_out = int(result['max'])
 
+  # Loss that is not exceeded with 95% probability is the start value less the
+  # 5% quantile of outcome, the mean of the worst 5% cases gives expected loss
+  # beyond it
+  loss = START_VALUE - int(mc_stats.quantile(stats, 1 - RISK_LEVEL))
+  tail_loss = START_VALUE - int(mc_stats.tail_mean(stats, 1 - RISK_LEVEL))
+  odds_low, odds_high = mc_stats.wilson_interval(stats)
+  avg_low, avg_high = mc_stats.mean_interval(stats)
 
   print("\nInitial investments = ${:,}".format(START_VALUE))
   print("Days hold (min-med-max): {}-{}-{}\n".format(MIN_HOLD, median_hold, MAX_HOLD))
-  print("Odds of ruin: {}%".format(odds))
-  print("Minimum outcome: ${:,}".format(min_out))
-  print("Average outcome: ${:,}".format(avg_out))
+  if stats['exact']:
+    print("Number of runs: {:,} (every start day and duration)".format(
+      int(result['count'])))
+    print("Odds of ruin: {}% (exact)".format(odds))
+    print("Minimum outcome: ${:,}".format(min_out))
+    print("Average outcome: ${:,}".format(avg_out))
+  else:
+    print("Number of runs: {:,}".format(result['count']))
+    print("Odds of ruin: {}% (95% interval {:.1f}-{:.1f}%)".format(
+      odds, 100 * odds_low, 100 * odds_high))
+    print("Minimum outcome: ${:,}".format(min_out))
+    print("Average outcome: ${:,} (95% interval {:,.0f}-{:,.0f})".format(
+      avg_out, avg_low, avg_high))
   print("Maximum outcome: ${:,}".format(max_out))
   print("Earnings at risk: ${:,}".format(loss))
+  print("Expected loss beyond it: ${:,}".format(tail_loss))
 
   return odds
 
 
 def main():
   median_hold = compute_median_hold(CUT_OFF_DATE)
-  etf_history = read_to_list('etf_returns.txt')
-  etf_yesterday = read_yesterday(date.today())
-  hist_file = open("etf_returns.txt", "a")
-  hist_file.writelines(str(etf_yesterday)+"\n")
-  hist_file.close()
-  etf_history.append(round(etf_yesterday / 100, 5))
+  etf_history = update_history(date.today())
   
   # Compute outcome and probs
-  outcome, bankrupt_count = montecarlo(etf_history, median_hold)
-  odds = bankrupt_prob(outcome, bankrupt_count, median_hold)
+  stats = montecarlo(etf_history, median_hold)
+  odds = bankrupt_prob(stats, median_hold)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+import numpy as np
+from arch import arch_model
+from concurrent.futures import ProcessPoolExecutor
+
+ARCH_P       = 3
+ARCH_Q       = 3
+CHUNK_STEPS  = 100 # Steps of one task when forecasting in parallel
+RESYNC_STEPS = 250 # Steps between exact recomputations of window moments
+
+
+def archModel(scaled_training):
+  return arch_model(scaled_training, mean='zero', vol='garch', p=ARCH_P,
+                    q=ARCH_Q, dist='normal')
+
+def windowMoments(window):
+  """Mean and standard deviation the way StandardScaler fits them"""
+  mean = np.mean(window)
+  std  = np.std(window)
+  return mean, (std if std > 0 else 1.0)
+
+def slideMoments(mean, var, n, x_out, x_in):
+  """Update mean and variance of a window of n values when x_out is replaced by x_in"""
+  new_mean = mean + (x_in - x_out) / n
+  var = var + (x_in - x_out) * (x_in - new_mean + x_out - mean) / n
+  return new_mean, max(var, 0.0)
+
+def forecastVariance(res, horizon, method):
+  """Forecast variance, analytic unless the model needs simulation for horizon"""
+  if method == 'analytic':
+    try:
+      return res.forecast(horizon=horizon, method='analytic').variance.values[-1]
+    except ValueError:
+      pass
+  return res.forecast(horizon=horizon, method='simulation').variance.values[-1]
+
+def rollingForecast(returns, first, last, look_back, horizon, start=None,
+                    method='analytic'):
+  """
+  Forecast of predictArch for every step from first up to last. The window of
+  look_back days moves by one day per step, the scaler mean and variance are
+  slid along with it and GARCH fit of a step starts from the parameters of the
+  previous step.
+  start  -- GARCH parameters to start the first fit from
+  method -- 'analytic' forecasts where the model allows, else 'simulation'
+  Returns dict of preallocated arrays: 'step', 'forecast' and 'testing' of
+  (steps x horizon), testing padded with nan past the data, and 'params'.
+  """
+  returns = np.asarray(returns, dtype=np.float64)
+  n_steps = max(last - first, 0)
+  result = {'step': np.arange(first, first + n_steps),
+            'forecast': np.full((n_steps, horizon), np.nan),
+            'testing': np.full((n_steps, horizon), np.nan),
+            'params': np.full((n_steps, 1 + ARCH_P + ARCH_Q), np.nan)}
+
+  for i, step in enumerate(range(first, first + n_steps)):
+    training = returns[step - look_back:step]
+    testing  = returns[step:step + horizon]
+    if i % RESYNC_STEPS == 0:
+      mean, std = windowMoments(training)
+      var = std ** 2
+    else:
+      mean, var = slideMoments(mean, var, look_back, returns[step - look_back - 1],
+                               returns[step - 1])
+      std = np.sqrt(var) if var > 0 else 1.0
+
+    res = archModel((training - mean) / std).fit(starting_values=start,
+                                                 update_freq=0, disp=False)
+    start = res.params.values
+    result['params'][i]   = start
+    result['forecast'][i] = forecastVariance(res, horizon, method) * std + mean
+    result['testing'][i, :len(testing)] = testing
+  return result
+
+def forecastScores(result):
+  """
+  Per step scores of predictArch from forecast arrays: 'mae model', 'mae naive'
+  of zero forecast, 'precision' of forecast signs and 'positives' in testing.
+  """
+  forecast, testing = result['forecast'], result['testing']
+  valid = ~np.isnan(testing)
+  with np.errstate(invalid='ignore'):
+    mae_model = np.nanmean(np.abs(testing - forecast), axis=1)
+    mae_naive = np.nanmean(np.abs(testing), axis=1)
+  test_pos = (testing >= 0) & valid
+  pred_pos = (forecast >= 0) & valid
+  hits     = np.sum(test_pos & pred_pos, axis=1)
+  calls    = np.sum(pred_pos, axis=1)
+  precision = np.where(calls > 0, hits / np.maximum(calls, 1), 0.0)
+  return {'mae model': mae_model,
+          'mae naive': mae_naive,
+          'precision': precision,
+          'positives': np.sum(test_pos, axis=1),
+          'step': result['step']}
+
+def forecastChunks(returns, first, last, look_back, horizon, method='analytic',
+                   chunk_steps=CHUNK_STEPS, workers=None):
+  """
+  rollingForecast over chunks of steps in a process pool. Every chunk starts
+  from a fresh fit and warm starts within, chunks are written into the result
+  arrays in step order. workers=1 runs in process, None uses all cores.
+  """
+  returns = np.asarray(returns, dtype=np.float64)
+  bounds  = [(s, min(s + chunk_steps, last)) for s in range(first, last, chunk_steps)]
+  args    = [(returns, s, e, look_back, horizon, None, method) for s, e in bounds]
+  if workers == 1 or len(bounds) <= 1:
+    chunks = [rollingForecast(*a) for a in args]
+  else:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      chunks = list(pool.map(rollingForecast, *zip(*args)))
+
+  n_steps = max(last - first, 0)
+  result = {'step': np.arange(first, first + n_steps),
+            'forecast': np.empty((n_steps, horizon)),
+            'testing': np.empty((n_steps, horizon)),
+            'params': np.empty((n_steps, 1 + ARCH_P + ARCH_Q))}
+  for (s, e), chunk in zip(bounds, chunks):
+    for key in ('forecast', 'testing', 'params'):
+      result[key][s - first:e - first] = chunk[key]
+  return result
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+from arch import arch_model
+from scipy import optimize
+from itertools import product
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from recursions import armaResiduals
+from recursions import garchVariance
+
+MAX_ITER   = 300 # SLSQP iterations of a full fit
+PROBE_ITER = 10  # SLSQP iterations of a probe fit used for pruning
+
+
+def computeEpsilon(c, phi, theta, r):
+  """
+  This function computes epsilon for using the formula for an ARMA(p, q) process
+  with intercept and returns an array of epsilons.
+  c - coefficient of intercept
+  phi - list of phi coefficients of length p
+  theta - list of theta coefficients of length q
+  r - an array of returns
+  """
+  return armaResiduals(c, phi, theta, r)
+
+def getSigma2(omega, alpha, beta, gamma, r, eps):
+  return garchVariance(omega, alpha, beta, eps)
+
+def llhNormal(params, p, q, r):
+  # We need constant, phi and theta for epsilon estimation in ARMA process
+  c     = params[0]
+  phi   = params[1:p+1]
+  theta = params[p+1:p+q+1]
+  # We need omega, alpha and beta params for GARCH process
+  omega, alpha, beta = params[-3:]
+  gamma = None
+  et = computeEpsilon(c, phi, theta, r)
+  sigma2 = getSigma2(omega, alpha, beta, gamma, r, et)
+  if any(sigma2 < 0):
+    sigma2[sigma2 < 0] = -1 * sigma2[sigma2 < 0]
+  llh    = -0.5 * (np.log(2*np.pi) + np.log(sigma2) + et**2 / (2*sigma2))
+  neg_llh   = -llh
+  total_llh = np.sum(neg_llh)
+  return total_llh
+
+def llhGradient(params, p, q, r):
+  """Exact gradient of llhNormal from forward mode recursions of the filters"""
+  params = np.asarray(params, dtype=np.float64)
+  c     = params[0]
+  phi   = params[1:p+1]
+  theta = params[p+1:p+q+1]
+  omega, alpha, beta = params[-3:]
+  et, et_jac = armaResiduals(c, phi, theta, r, gradient=True)
+  sigma2, sigma2_jac = garchVariance(omega, alpha, beta, et, et_jac, gradient=True)
+  # llhNormal flips negative variances, so do their derivatives
+  sign = np.where(sigma2 < 0, -1.0, 1.0)
+  sigma2     = sign * sigma2
+  sigma2_jac = sign[:, None] * sigma2_jac
+  d_sigma2 = 0.5 * (1 / sigma2 - et**2 / (2 * sigma2**2))
+  d_et     = 0.5 * et / sigma2
+  grad = sigma2_jac.T @ d_sigma2
+  grad[:p+q+1] += et_jac.T @ d_et
+  return grad
+
+def cons0(params, p, q, r):
+  alpha, beta = params[-2:]
+  return 1.0 - np.finfo(np.float64).eps - alpha - beta
+
+def cons1(params, p, q, r):
+  return 1.0 - np.sum(params[1:p+1]) - np.finfo(np.float64).eps
+
+def trainModel(r, p, q, x0=None, iters=MAX_ITER, gradient=True):
+  """
+  Fit ARMA(p, q)-GARCH(1, 1) by maximum likelihood with SLSQP.
+  x0 -- parameters to start from, e.g. the fit of the previous window, moved
+        inside the bounds of this window. None starts from the defaults.
+  iters -- maximum number of SLSQP iterations
+  gradient -- use exact gradient of likelihood, False takes finite differences
+  """
+  np.seterr(divide='ignore', invalid='ignore', over='ignore')
+  e = np.finfo(np.float64).eps
+  bounds = [(-10*np.abs(np.mean(r)), 10*np.abs(np.mean(r)))] + \
+           [(-0.999999, 0.999999) for _ in range(p + q)] + \
+           [(e, 2 * np.var(r))]
+  alpha_bounds, beta_bounds = [(e, 1.0 - e) for _ in range(2)]
+  initial_params = [0.001 for _ in range(p + q + 1)]
+  initial_params = initial_params + [0.001, 0.1, 0.8]
+  bounds = bounds + [alpha_bounds, beta_bounds]
+  if x0 is not None:
+    lower, upper = np.array(bounds).T
+    initial_params = np.clip(x0, lower, upper).tolist()
+  min_func = llhNormal
+  min_grad = llhGradient if gradient else None
+  eqcons   = []
+  ieqcons  = [cons0, cons1]
+  result = optimize.fmin_slsqp(func = min_func,
+                               x0   = initial_params,
+                               fprime  = min_grad,
+                               ieqcons = ieqcons,
+                               eqcons  = eqcons,
+                               bounds  = bounds,
+                               epsilon = 1e-6,
+                               acc     = 1e-7,
+                               full_output = True,
+                               iprint  = 0,
+                               args    = (p, q, r),
+                               iter    = iters)
+  return result
+
+def fitOrders(r, orders, starts, iters, workers=None):
+  """
+  trainModel results of a list of (p, q) orders. Fits are independent, so
+  they run in a process pool, workers=1 runs them in process.
+  """
+  ps = [order[0] for order in orders]
+  qs = [order[1] for order in orders]
+  if workers == 1 or len(orders) <= 1:
+    return list(map(trainModel, repeat(r), ps, qs, starts, repeat(iters)))
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    return list(pool.map(trainModel, repeat(r), ps, qs, starts, repeat(iters)))
+
+def selectOrder(r, max_p, max_q, starts=None, workers=None, prune_margin=None):
+  """
+  Fit every (p, q) up to max_p, max_q in a process pool and pick the order of
+  the best AIC.
+  starts  -- dict of parameters by (p, q) to warm start the fits from
+  workers -- number of processes, None uses all cores, 1 runs in process
+  prune_margin -- if set, every order gets a short probe fit first and only
+                  orders with probe AIC within the margin of the best probe
+                  are fitted in full, the rest are marked as pruned
+  Returns best p, best q and DataFrame of 'p', 'q', 'neg llh', 'aic', 'bic',
+  'iterations', 'converged', 'pruned' and 'params' of every order.
+  """
+  r       = np.asarray(r, dtype=np.float64)
+  starts  = starts or {}
+  orders  = [(int(p), int(q)) for p, q in product(range(max_p + 1), range(max_q + 1))]
+  x0      = [starts.get(order) for order in orders]
+  results = [None] * len(orders)
+  pruned  = np.zeros(len(orders), dtype=bool)
+
+  if prune_margin is not None:
+    probes = fitOrders(r, orders, x0, PROBE_ITER, workers)
+    aic    = np.array([2 * result[1] + 2 * len(result[0]) for result in probes])
+    pruned = ~(aic <= np.nanmin(aic) + prune_margin)
+    x0     = [result[0] for result in probes]
+    results = probes
+
+  full = np.flatnonzero(~pruned)
+  fits = fitOrders(r, [orders[i] for i in full], [x0[i] for i in full],
+                   MAX_ITER, workers)
+  for i, result in zip(full, fits):
+    results[i] = result
+
+  rows = []
+  for (p, q), result, cut in zip(orders, results, pruned):
+    params, neg_llh, iterations, mode, _ = result
+    rows.append({'p': p,
+                 'q': q,
+                 'neg llh': neg_llh,
+                 'aic': 2 * neg_llh + 2 * len(params),
+                 'bic': 2 * neg_llh + np.log(len(r)) * len(params),
+                 'iterations': iterations,
+                 'converged': mode == 0,
+                 'pruned': cut,
+                 'params': params})
+  table = pd.DataFrame(rows)
+  # First order of the lowest AIC wins, orders of nan AIC never do
+  scores = table['aic'].where(~table['pruned'])
+  if scores.isna().all():
+    raise ValueError('No ARMA-GARCH order could be fitted')
+  best = scores.idxmin()
+  return table.loc[best, 'p'], table.loc[best, 'q'], table
+
+def simultaneousLlh(r, max_p, max_q, workers=None):
+  best_p, best_q, _ = selectOrder(r, max_p, max_q, workers=workers)
+  return best_p, best_q
+
+def trainArma(r, p, q, start=None):
+  """SARIMAX fit of ARMA(p, q) with intercept, start -- params to start from"""
+  arima_model = sm.tsa.statespace.SARIMAX(r,
+                                          trend = 'c',
+                                          order = (p, 0, q),
+                                          enforce_stationarity=False,
+                                          enforce_invertibility=False)
+  arima_result = arima_model.fit(start_params=start, disp=False)
+  arima_resids = arima_result.resid
+  return arima_result, arima_resids
+
+def garchModel(scaled_training):
+  archm = arch_model(scaled_training,
+                     mean = 'zero',
+                     vol  = 'garch',
+                     p    = 1,
+                     q    = 1,
+                     dist = 'Normal')
+  return archm
+
+def trainGarch(scaled_training, start=None):
+  """GARCH(1, 1) fit of scaled residuals, start -- params to start from"""
+  archm = garchModel(scaled_training)
+  gjr = archm.fit(starting_values=start, update_freq=100, disp=False)
+  return gjr
@@ -1,15 +1,18 @@
 from datetime import datetime
-import yfinance as yf
+import market_data
 import numpy as np
 
+# Both tickers come from one request and stay in local cache for other scripts
 start_date = datetime(2002, 1, 1)
 end_date   = datetime(2023, 7, 27)
-sp500 = yf.download('^GSPC', start=start_date, end=end_date)
+history = market_data.read_history(['^GSPC', 'IUIT.L'], start_date, end_date)
+sp500 = history['^GSPC']
 sp500.to_csv('sp500_daily_history_2002_2023.csv')
 
 # Ishares SP500 InformationTechnology Sector
 # IUIT.L
 start_date = datetime(2017, 1, 1) ## started in 2016-06, but use 2017-1-1 here
 end_date   = datetime(2023, 7, 27) ## always one day before current
-iuit = yf.download('IUIT.L', start=start_date, end=end_date)
+iuit = history['IUIT.L']
+iuit = iuit[(iuit.index >= start_date) & (iuit.index < end_date)]
 iuit.to_csv('ishares_sp500_it_etf_history_2017_2023.csv')
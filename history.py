@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+
+import os
+import glob
+import numpy as np
+from functools import lru_cache
+from numpy.lib.stride_tricks import sliding_window_view
+
+CACHE_DIR = '.history_cache'
+
+
+def read_to_list(file_name):
+  '''Read history of returns and convert to decimal'''
+  with open(file_name) as in_file:
+    lines   = [float(line.strip()) for line in in_file]
+    decimal = [round(line / 100, 5) for line in lines]
+    return decimal
+
+
+def sidecar_name(file_name, size, mtime_ns):
+  '''Binary copy of a text file lives next to it, keyed by its size and mtime'''
+  folder, base = os.path.split(file_name)
+  return os.path.join(folder, CACHE_DIR,
+                      '{}.{}.{}.npy'.format(base, size, mtime_ns))
+
+
+def load_returns(file_name):
+  '''
+  Load history of returns in percent as decimal float64 array. Text is parsed
+  once per version of the file and saved as .npy sidecar that later runs map
+  straight into memory. Loads are memoized within a process, so repeated calls
+  and sweep workers never touch the text parser again. Returned array is read
+  only and shared between callers.
+  '''
+  stat = os.stat(file_name)
+  return load_version(os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=None)
+def load_version(file_name, size, mtime_ns):
+  sidecar = sidecar_name(file_name, size, mtime_ns)
+  try:
+    return np.load(sidecar, mmap_mode='r')
+  except FileNotFoundError:
+    pass
+
+  decimal = np.array(read_to_list(file_name), dtype=np.float64)
+  try:
+    os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+    # Drop sidecars of older versions of the same file, the current one may
+    # have just been written by another process loading it at the same time
+    for stale in glob.glob(sidecar_name(file_name, '*', '*')):
+      if stale == sidecar:
+        continue
+      try:
+        os.remove(stale)
+      except FileNotFoundError:
+        pass
+    temp = sidecar + '.{}.tmp'.format(os.getpid())
+    with open(temp, 'wb') as out_file:
+      np.save(out_file, decimal)
+    os.replace(temp, sidecar)
+    return np.load(sidecar, mmap_mode='r')
+  except OSError:
+    # Read only location, or sidecar removed by a process that loads a newer
+    # version of the file, keep parsed history in memory only
+    decimal.flags.writeable = False
+    return decimal
+
+
+def circular_history(returns, max_window):
+  '''
+  Build circular history once from a list of decimal returns. The series is
+  tiled into a contiguous buffer long enough to hold a window of max_window
+  periods from any start, so a wrapped window is a plain slice instead of a
+  list rebuilt with i % len(returns). Prefix sums of log returns give the
+  compounded growth of any window in O(1).
+  '''
+  returns = np.asarray(returns, dtype=np.float64)
+  size = len(returns)
+  reps = -(-(size + max_window) // size)
+  buffer = np.tile(returns, reps)[:size + max_window]
+  log_prefix = np.zeros(len(buffer) + 1)
+  np.cumsum(np.log1p(buffer), out=log_prefix[1:])
+  return {'size': size,
+          'max_window': max_window,
+          'buffer': buffer,
+          'log_prefix': log_prefix}
+
+
+def check_window(hist, duration):
+  duration = np.asarray(duration)
+  if np.any(duration > hist['max_window']):
+    raise ValueError('Window is longer than {} periods'.format(hist['max_window']))
+  if np.any(duration < 0):
+    raise ValueError('Window of negative length')
+
+
+def window(hist, start, duration):
+  '''Return zero-copy slice of returns for one wrapped window'''
+  check_window(hist, duration)
+  return hist['buffer'][start:start + duration]
+
+
+def windows(hist, start, width):
+  '''Return (cases x width) matrix of wrapped windows for array of starts'''
+  check_window(hist, width)
+  view = sliding_window_view(hist['buffer'], width)
+  return view[np.asarray(start)]
+
+
+def window_growth(hist, start, duration):
+  '''Return compounded growth factor of window(s) from log prefix sums'''
+  check_window(hist, duration)
+  start = np.asarray(start)
+  log_prefix = hist['log_prefix']
+  return np.exp(log_prefix[start + duration] - log_prefix[start])
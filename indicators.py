@@ -0,0 +1,97 @@
+import numpy as np
+from functools import lru_cache
+from scipy.signal import lfilter
+
+NEUTRAL_RSI = 50.0
+
+
+def computeReturns(prices):
+  diffs   = np.diff(prices).tolist()
+  prices  = np.delete(prices, len(prices) - 1).tolist()
+  returns = [round(a / b, 5) for a,b in zip(diffs, prices)]
+  returns = [0.00000] + returns
+  return returns
+
+def computeRsi(returns):
+  up_close   = int(np.count_nonzero(np.asarray(returns) > 0))
+  down_close = int(np.count_nonzero(np.asarray(returns) < 0))
+  return rsiFromCounts(up_close, down_close)
+
+def rsiFromCounts(up_close, down_close):
+  if down_close == 0:
+    down_close = 1
+  rs_val = round(up_close / down_close, 2)
+  rsi    = round(100 - (100 / (1 + rs_val)), 2)
+  return rsi
+
+@lru_cache(maxsize=None)
+def rsiTable(look_back):
+  """
+  RSI for every pair of (up, down) counts in a window of look_back days. The
+  table is built with the same rounding as computeRsi, so a lookup gives the
+  exact value of the scalar function.
+  """
+  table = np.zeros((look_back + 1, look_back + 1))
+  for up_close in range(look_back + 1):
+    for down_close in range(look_back + 1 - up_close):
+      table[up_close, down_close] = rsiFromCounts(up_close, down_close)
+  table.flags.writeable = False
+  return table
+
+def windowCounts(flags, burn_in, look_back):
+  """
+  Number of flagged returns in window returns[day - look_back:day] for every
+  day from burn_in, using differences of cumulative sums. For days before
+  look_back the window start is a negative slice index, which wraps around
+  the day's history the way ytd_returns[len - look_back:len] did.
+  """
+  cumul = np.zeros(len(flags) + 1, dtype=np.int64)
+  np.cumsum(flags, out=cumul[1:])
+  days  = np.arange(burn_in, len(flags))
+  start = days - look_back
+  start = np.where(start < 0, np.maximum(start + days, 0), start)
+  return cumul[days] - cumul[start]
+
+def wilderAverage(values, look_back):
+  """
+  Wilder smoothing of values: simple average of the first look_back values,
+  then avg[t] = avg[t-1] * (look_back - 1) / look_back + values[t] / look_back.
+  Days before the first full window use the average of available values.
+  """
+  values = np.asarray(values, dtype=np.float64)
+  avg = np.cumsum(values) / np.arange(1, len(values) + 1)
+  if len(values) > look_back:
+    decay = (look_back - 1) / look_back
+    zi = [decay * avg[look_back - 1]]
+    avg[look_back:], _ = lfilter([1 / look_back], [1, -decay],
+                                 values[look_back:], zi=zi)
+  return avg
+
+def computeRsiList(returns, burn_in, look_back, method='count'):
+  """
+  RSI for every day computed from returns of look_back days before the day.
+  Days of burn in period get neutral RSI.
+  method -- 'count' for RSI from number of up and down closes as computeRsi
+            does, 'wilder' for standard RSI of Wilder smoothed gains and losses
+  """
+  returns = np.asarray(returns, dtype=np.float64)
+  prefix  = np.full(burn_in, NEUTRAL_RSI)
+
+  if method == 'count':
+    up_close   = windowCounts(returns > 0, burn_in, look_back)
+    down_close = windowCounts(returns < 0, burn_in, look_back)
+    rsi = rsiTable(look_back)[up_close, down_close]
+  elif method == 'wilder':
+    avg_gain = wilderAverage(np.maximum(returns, 0), look_back)
+    avg_loss = wilderAverage(np.maximum(-returns, 0), look_back)
+    # RSI of a day uses averages up to the day before
+    days = np.arange(burn_in, len(returns))
+    gain = np.where(days > 0, avg_gain[days - 1], 0.0)
+    loss = np.where(days > 0, avg_loss[days - 1], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      rsi = 100 - 100 / (1 + gain / loss)
+    rsi = np.where(loss == 0, np.where(gain == 0, NEUTRAL_RSI, 100.0), rsi)
+    rsi = np.round(rsi, 2)
+  else:
+    raise ValueError('Unknown RSI method: {}'.format(method))
+  return np.concatenate([prefix, rsi])
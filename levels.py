@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+
+def runsEnding(steps):
+  """Length of the run of True values ending at every position"""
+  idx = np.arange(len(steps))
+  last_break = np.maximum.accumulate(np.where(steps, -1, idx))
+  return idx - last_break
+
+def runsStarting(steps):
+  """Length of the run of True values starting at every position"""
+  return runsEnding(steps[::-1])[::-1]
+
+def runsAfter(steps):
+  """Length of the run starting at the step after every position"""
+  return np.append(runsStarting(steps)[1:], 0)
+
+def pivotRuns(low, high):
+  """
+  Run lengths of non-increasing and non-decreasing steps of lows and highs.
+  Step i compares bar i with bar i-1, the first bar has no step.
+  """
+  low  = np.asarray(low, dtype=np.float64)
+  high = np.asarray(high, dtype=np.float64)
+  low_falls  = np.zeros(len(low), dtype=bool)
+  low_rises  = np.zeros(len(low), dtype=bool)
+  high_rises = np.zeros(len(high), dtype=bool)
+  high_falls = np.zeros(len(high), dtype=bool)
+  low_falls[1:]  = low[1:] <= low[:-1]
+  low_rises[1:]  = low[1:] >= low[:-1]
+  high_rises[1:] = high[1:] >= high[:-1]
+  high_falls[1:] = high[1:] <= high[:-1]
+  return {'low before': runsEnding(low_falls),
+          'low after': runsAfter(low_rises),
+          'high before': runsEnding(high_rises),
+          'high after': runsAfter(high_falls)}
+
+def findPivots(runs, n1, n2, dur):
+  """
+  Flag support and resistance pivots of rows from n1 up to dur. Support is a
+  low with n1 non-increasing lows before and n2 non-decreasing lows after it,
+  resistance is the same for highs with the directions swapped.
+  """
+  rows = np.arange(len(runs['low before']))
+  valid = (rows >= n1) & (rows < dur)
+  support    = valid & (runs['low before'] >= n1) & (runs['low after'] >= n2)
+  resistance = valid & (runs['high before'] >= n1) & (runs['high after'] >= n2)
+  return support, resistance
+
+def levelsFrame(dt, support, resistance):
+  """Pivots as rows of (idx, value, type) by day, support before resistance"""
+  sup_idx = np.flatnonzero(support)
+  res_idx = np.flatnonzero(resistance)
+  idx   = np.concatenate([sup_idx, res_idx])
+  kind  = np.concatenate([np.zeros(len(sup_idx), dtype=int),
+                          np.ones(len(res_idx), dtype=int)])
+  value = np.concatenate([dt['Low'].to_numpy()[sup_idx],
+                          dt['High'].to_numpy()[res_idx]])
+  order = np.lexsort((kind, idx))
+  return pd.DataFrame({'idx': idx[order],
+                       'value': value[order],
+                       'type': np.array(['support', 'resistance'])[kind[order]]})
+
+def findLevels(dt, n1, n2, dur):
+  runs = pivotRuns(dt['Low'].to_numpy(), dt['High'].to_numpy())
+  support, resistance = findPivots(runs, n1, n2, dur)
+  return levelsFrame(dt, support, resistance)
+
+def findLevelsMulti(dt, pairs, dur=None):
+  """
+  Levels for many (n1, n2) pairs from a single pass of run lengths. dur is
+  the end row, by default the last row that has n2 bars after it.
+  """
+  runs = pivotRuns(dt['Low'].to_numpy(), dt['High'].to_numpy())
+  frames = []
+  for n1, n2 in pairs:
+    end = len(dt) - n2 if dur is None else dur
+    support, resistance = findPivots(runs, n1, n2, end)
+    frame = levelsFrame(dt, support, resistance)
+    frame.insert(0, 'n2', n2)
+    frame.insert(0, 'n1', n1)
+    frames.append(frame)
+  return pd.concat(frames, ignore_index=True)
+
+def levelIndex(levels, n_days):
+  """
+  Index of levels for fast lookups. For each type keeps pivot days sorted and
+  their values for searchsorted queries, and a forward filled array of the
+  latest level as of every day below n_days (0.0 before the first pivot).
+  """
+  index = {'days': n_days}
+  for kind in ('support', 'resistance'):
+    rows  = levels[levels['type'] == kind]
+    idx   = rows['idx'].to_numpy()
+    value = rows['value'].to_numpy(dtype=np.float64)
+    order = np.argsort(idx, kind='stable')
+    idx, value = idx[order], value[order]
+    pos = np.searchsorted(idx, np.arange(n_days), side='right') - 1
+    index[kind + ' idx']   = idx
+    index[kind + ' value'] = value
+    index[kind] = np.where(pos >= 0, value[np.maximum(pos, 0)], 0.0)
+  return index
+
+def latestLevels(index, day):
+  """Latest support and resistance as of day, same result as findLatest"""
+  result = {}
+  for kind in ('support', 'resistance'):
+    if 0 <= day < index['days']:
+      result[kind] = float(index[kind][day])
+      continue
+    pos = np.searchsorted(index[kind + ' idx'], day, side='right') - 1
+    result[kind] = float(index[kind + ' value'][pos]) if pos >= 0 else 0.0
+  return result
+
+def generateSignals(close, index, days, burn_in):
+  """
+  Signals of all days at once: buy below latest support, sell above latest
+  resistance, hold otherwise. Days before burn_in get an empty hold signal
+  of day 0 the way sendSignal marks them.
+  """
+  close = np.asarray(close, dtype=np.float64)
+  days  = np.asarray(days)
+  ready = days >= burn_in
+  support    = np.where(ready, index['support'][days], 0.0)
+  resistance = np.where(ready, index['resistance'][days], 0.0)
+  price      = np.where(ready, close[days], 0.0)
+  action = np.where(price > resistance, 'sell',
+                    np.where(price < support, 'buy', 'hold'))
+  action = np.where(ready, action, 'hold')
+  return pd.DataFrame({'day': np.where(ready, days, 0),
+                       'support': support,
+                       'resistance': resistance,
+                       'price': price,
+                       'action': action.astype(object)})
@@ -1,7 +1,7 @@
 import random
 import numpy as np
 import pandas as pd
-import yfinance as yf
+import market_data
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
 
@@ -25,7 +25,7 @@ from itertools import product
 def readYfData(idx):
   start_date = datetime(2016, 1, 1)
   end_date   = date.today()
-  etf_df = yf.download(idx, start=start_date, end=end_date)
+  etf_df = market_data.read_history(idx, start_date, end_date)
   return etf_df
 
 iuit_l = readYfData('IUIT.L')
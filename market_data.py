@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+import os
+import numpy as np
+import pandas as pd
+from datetime import date
+from datetime import datetime
+
+CACHE_DIR = '.market_cache'
+COLUMNS   = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+RECORD    = np.dtype([('date', '<M8[D]')] + [(c, '<f8') for c in COLUMNS])
+SOURCE    = None # Source of bars, None downloads from Yahoo Finance
+SETTLE_DAYS = 2  # Latest days never marked covered, their bars may come late
+
+
+def yahoo_source(tickers, start, end):
+  '''Download daily bars of several tickers in one request'''
+  import yfinance as yf
+  data = yf.download(tickers, start=start, end=end, group_by='ticker',
+                     auto_adjust=False, progress=False)
+  result = {}
+  for ticker in tickers:
+    if isinstance(data.columns, pd.MultiIndex):
+      if ticker not in data.columns.get_level_values(0):
+        continue
+      frame = data[ticker]
+    else:
+      frame = data
+    result[ticker] = frame.dropna(how='all')
+  return result
+
+
+def csv_source(folder):
+  '''
+  Return source that reads <ticker>.csv files saved from yf.download, e.g.
+  local fixtures for tests instead of the network
+  '''
+  def source(tickers, start, end):
+    result = {}
+    for ticker in tickers:
+      path = os.path.join(folder, '{}.csv'.format(ticker))
+      if not os.path.exists(path):
+        continue
+      frame = pd.read_csv(path, index_col=0, parse_dates=True)
+      dates = frame.index.values.astype('M8[D]')
+      frame = frame[(dates >= to_day(start)) & (dates < to_day(end))]
+      result[ticker] = frame
+    return result
+  return source
+
+
+def to_day(day):
+  if isinstance(day, datetime):
+    day = day.date()
+  return np.datetime64(day, 'D')
+
+
+def cache_path(ticker, cache_dir):
+  return os.path.join(cache_dir, '{}.npz'.format(ticker))
+
+
+def read_cache(ticker, cache_dir):
+  '''Return cached bars and covered (start, end) range or None'''
+  path = cache_path(ticker, cache_dir)
+  if not os.path.exists(path):
+    return None, None
+  with np.load(path) as cached:
+    return cached['bars'], tuple(cached['covered'])
+
+
+def write_cache(ticker, cache_dir, bars, covered):
+  os.makedirs(cache_dir, exist_ok=True)
+  path = cache_path(ticker, cache_dir)
+  temp = path + '.{}.tmp'.format(os.getpid())
+  with open(temp, 'wb') as out_file:
+    np.savez(out_file, bars=bars, covered=np.array(covered, dtype='M8[D]'))
+  os.replace(temp, path)
+
+
+def to_records(frame):
+  records = np.zeros(len(frame), dtype=RECORD)
+  records['date'] = frame.index.values.astype('M8[D]')
+  for column in COLUMNS:
+    if column in frame.columns:
+      records[column] = frame[column].to_numpy(dtype=np.float64)
+    else:
+      records[column] = np.nan
+  return records
+
+
+def to_frame(records):
+  frame = pd.DataFrame({c: records[c] for c in COLUMNS},
+                       index=pd.DatetimeIndex(records['date'], name='Date'))
+  return frame
+
+
+def merge_records(old, new):
+  '''Join bars keeping the newest copy of every day'''
+  bars  = np.concatenate([new, old])
+  _, first = np.unique(bars['date'], return_index=True)
+  return bars[first]
+
+
+def missing_ranges(covered, start, end):
+  '''Return ranges of days in [start, end) that the cache does not cover'''
+  if covered is None:
+    return [(start, end)]
+  ranges = []
+  if start < covered[0]:
+    ranges.append((start, covered[0]))
+  if end > covered[1]:
+    ranges.append((covered[1], end))
+  return ranges
+
+
+def covered_range(covered, gap_start, gap_end, new, settled):
+  '''
+  Range the cache covers after a request of [gap_start, gap_end) returned
+  new bars. An empty answer, which is also what a failed download gives,
+  covers nothing. The tail is covered only up to the day after the last bar
+  received and never past settled, so days without published bars yet are
+  requested again.
+  '''
+  if len(new) == 0:
+    return covered
+  if covered is not None and gap_end <= covered[0]:
+    return (gap_start, covered[1])
+  end = min(gap_end, new['date'].max() + 1, settled)
+  if covered is None:
+    return (gap_start, max(gap_start, end))
+  return (covered[0], max(covered[1], end))
+
+
+def read_history(tickers, start, end=None, source=None, cache_dir=CACHE_DIR):
+  '''
+  Return daily bars from start up to end (exclusive) as DataFrame for one
+  ticker or dict of DataFrames for a list of tickers. Bars are cached on disk
+  per ticker together with the range already requested, so a run downloads
+  only the missing head or tail of history. Tickers missing the same range
+  are downloaded in one request.
+  '''
+  single = isinstance(tickers, str)
+  if single:
+    tickers = [tickers]
+  start  = to_day(start)
+  end    = to_day(date.today() if end is None else end)
+  source = source or SOURCE or yahoo_source
+  settled = to_day(date.today()) - SETTLE_DAYS
+
+  cache    = {t: read_cache(t, cache_dir) for t in tickers}
+  requests = {}
+  for ticker in tickers:
+    for gap in missing_ranges(cache[ticker][1], start, end):
+      requests.setdefault(gap, []).append(ticker)
+
+  for (gap_start, gap_end), group in requests.items():
+    frames = source(group, gap_start.astype(date), gap_end.astype(date))
+    for ticker in group:
+      bars, covered = cache[ticker]
+      new = to_records(frames[ticker]) if ticker in frames \
+            else np.zeros(0, dtype=RECORD)
+      if len(new) == 0:
+        continue
+      bars = new if bars is None else merge_records(bars, new)
+      covered = covered_range(covered, gap_start, gap_end, new, settled)
+      write_cache(ticker, cache_dir, bars, covered)
+      cache[ticker] = (bars, covered)
+
+  result = {}
+  for ticker in tickers:
+    bars = cache[ticker][0]
+    if bars is None:
+      bars = np.zeros(0, dtype=RECORD)
+    bars = bars[(bars['date'] >= start) & (bars['date'] < end)]
+    result[ticker] = to_frame(bars)
+  if single:
+    return result[tickers[0]]
+  return result
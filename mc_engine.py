@@ -0,0 +1,358 @@
+#!/usr/bin/python3
+
+import numpy as np
+import history
+import mc_stats
+
+BATCH_SIZE = 100000
+SAMPLING   = ('random', 'antithetic', 'stratified')
+ADAPT_BATCH = 5000   # Cases between convergence checks of adaptive runs
+ODDS_WIDTH  = 0.005  # Half width of interval on ruin odds to stop at
+MEAN_WIDTH  = 0.01   # Half width of interval on mean outcome, relative to mean
+ENUM_LIMIT  = 100000 # Most (start, duration) pairs to enumerate instead of sampling
+
+
+def triangular(u, low, high, mode):
+  '''
+  Vectorized random.triangular(low, high, mode) applied to uniform draws. It
+  follows the stdlib formula, so unlike numpy it accepts a mode outside of
+  [low, high] -- e.g. median hold shorter than minimum hold.
+  '''
+  if high == low:
+    return np.full(np.shape(u), float(low))
+  c = (mode - low) / (high - low)
+  flip = u > c
+  u  = np.where(flip, 1.0 - u, u)
+  c  = np.where(flip, 1.0 - c, c)
+  lo = np.where(flip, high, low)
+  hi = np.where(flip, low, high)
+  return lo + (hi - lo) * np.sqrt(u * c)
+
+
+def max_duration(low, high, mode):
+  '''
+  Longest duration draw_cases can give. With the stdlib formula a mode above
+  high stretches draws beyond high, e.g. median hold longer than maximum hold.
+  '''
+  if high == low:
+    return int(low)
+  c = (mode - low) / (high - low)
+  return int(np.floor(max(high, low + (high - low) * np.sqrt(max(c, 1.0)))))
+
+
+def triangular_cdf(x, low, high, mode):
+  '''
+  Probability that triangular(u, low, high, mode) of a uniform u is below x.
+  Both branches of triangular are inverted, so a mode outside of [low, high]
+  gives the distribution the stdlib formula actually draws from.
+  '''
+  x = np.asarray(x, dtype=np.float64)
+  if high == low:
+    return (x > low).astype(np.float64)
+  c = (mode - low) / (high - low)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    rising  = (np.maximum(x - low, 0) / (high - low)) ** 2 / c
+    falling = 1 - (np.maximum(high - x, 0) / (high - low)) ** 2 / (1 - c)
+  cdf = np.where(x <= mode, rising, falling)
+  return np.clip(np.nan_to_num(cdf), 0.0, 1.0)
+
+
+def duration_pmf(low, high, mode):
+  '''
+  Durations draw_cases can give and their probabilities. A duration is the
+  truncated triangular draw clamped at zero, so P(D = k) = F(k + 1) - F(k)
+  and D = 0 takes all the mass below one.
+  '''
+  duration = np.arange(max_duration(low, high, mode) + 1)
+  cdf  = triangular_cdf(duration + 1, low, high, mode)
+  prob = np.diff(cdf, prepend=0.0)
+  keep = prob > 0
+  return duration[keep], prob[keep]
+
+
+def enumerate_cases(n_years, low, high, mode, limit=ENUM_LIMIT):
+  '''
+  Every (start year, duration) pair draw_cases can give with its probability,
+  start years being equally likely. Returns start_year, duration and weight
+  arrays, or None if there are more than limit pairs and the space should be
+  sampled instead (e.g. days of ETF history).
+  '''
+  duration, prob = duration_pmf(low, high, mode)
+  if not np.isclose(np.sum(prob), 1.0):
+    raise ValueError('Durations of enumeration miss part of the distribution')
+  if n_years * len(duration) > limit:
+    return None
+  start_year = np.repeat(np.arange(n_years), len(duration))
+  return start_year, np.tile(duration, n_years), np.tile(prob, n_years) / n_years
+
+
+def draw_uniform(num_cases, rng, sampling='random'):
+  '''
+  Uniform draws of all cases. 'antithetic' pairs every even case with the
+  next one as u and 1 - u, so chunks of even size keep their pairs when
+  joined. 'stratified' puts exactly one case in each of num_cases equal
+  strata of [0, 1) in random order.
+  '''
+  num_cases = int(num_cases)
+  if sampling == 'random':
+    return rng.random(num_cases)
+  if sampling == 'antithetic':
+    u = rng.random(num_cases)
+    u[1::2] = 1.0 - u[:num_cases - num_cases % 2:2]
+    return u
+  if sampling == 'stratified':
+    return (rng.permutation(num_cases) + rng.random(num_cases)) / num_cases
+  raise ValueError('Unknown sampling: {}'.format(sampling))
+
+
+def draw_starts(n_years, num_cases, rng=None, sampling='random'):
+  '''Start years of all cases, stratified sampling spreads them evenly over history'''
+  rng = np.random.default_rng(rng)
+  if sampling == 'random':
+    return rng.integers(0, n_years, size=int(num_cases))
+  u = draw_uniform(num_cases, rng, sampling)
+  return np.minimum((u * n_years).astype(np.int64), n_years - 1)
+
+
+def draw_cases(n_years, num_cases, low, high, mode, rng=None, sampling='random'):
+  '''
+  Draw start years and triangular durations for all cases at once. Start
+  years and durations are sampled independently with the same sampling
+  scheme, one of SAMPLING, 'random' gives the plain draws. A mode below low
+  lets the stdlib formula draw negative durations, those are held for zero
+  periods as range(duration) of the per-case loop did.
+  '''
+  rng = np.random.default_rng(rng)
+  start_year = draw_starts(n_years, num_cases, rng, sampling)
+  duration = triangular(draw_uniform(num_cases, rng, sampling), low, high, mode)
+  duration = np.maximum(np.trunc(duration), 0).astype(np.int64)
+  return start_year, duration
+
+
+def hold_outcomes(hist, start_day, duration, start_value, truncate=False):
+  '''
+  Final value of start_value held over every sampled (start, duration) window
+  of circular history. Growth of a window is the ratio of two prefix products
+  of growth factors, taken as a difference of log prefix sums. With truncate
+  the value is cut to whole units after every day as the per-day loop did,
+  stepping all cases together one day at a time.
+  '''
+  if not truncate:
+    growth = history.window_growth(hist, start_day, duration)
+    return np.trunc(start_value * growth).astype(np.int64)
+
+  history.check_window(hist, duration)
+  buffer = hist['buffer']
+  investments = np.full(len(start_day), float(start_value))
+  for day in range(int(duration.max()) if len(duration) else 0):
+    held = day < duration
+    growth = 1 + buffer[start_day[held] + day]
+    investments[held] = np.trunc(investments[held] * growth)
+  return investments.astype(np.int64)
+
+
+def accumulation_factors(returns_path, duration):
+  '''
+  Growth of savings with a fixed addition every year. Balance follows
+  s[k] = (s[k-1] + a) * g[k], which unrolls to s[n] = G[n] * (s[0] + a * H[n])
+  with G the cumulative growth and H[n] = sum(1 / G[k-1]) for k = 1..n.
+  Returns G[n] and H[n] for every case, so any start value and addition are
+  two multiplications away.
+  '''
+  cases, width = returns_path.shape
+  alive_year = np.arange(width) < np.broadcast_to(duration, (cases,))[:, None]
+  growth = np.where(alive_year, 1 + returns_path, 1.0)
+  cum_growth = np.cumprod(growth, axis=1)
+  prev_growth = np.ones((cases, width))
+  prev_growth[:, 1:] = cum_growth[:, :-1]
+  final_growth = cum_growth[:, -1] if width else np.ones(cases)
+  return final_growth, np.sum(np.where(alive_year, 1 / prev_growth, 0.0), axis=1)
+
+
+def decumulation_factors(returns_path, infl_path, duration):
+  '''
+  Withdrawal of one unit adjusted by inflation and growth of the rest for
+  every case. Balance follows b[k] = (b[k-1] - w[k]) * g[k], which unrolls to
+  b[k] = G[k] * (b[0] - W * D[k]) with G the cumulative growth and
+  D[k] = sum(I[j] / G[j-1]) the discounted withdrawals of unit W, I being the
+  inflation index. Returns final growth G and (cases x width) D.
+  '''
+  cases, width = returns_path.shape
+  alive_year = np.arange(width) < duration[:, None]
+
+  growth = np.where(alive_year, 1 + returns_path, 1.0)
+  infl_adj = np.where(alive_year, 1 + infl_path, 1.0)
+  infl_adj[:, 0] = 1.0
+  withdraw = np.where(alive_year, np.cumprod(infl_adj, axis=1), 0.0)
+
+  cum_growth = np.cumprod(growth, axis=1)
+  prev_growth = np.ones_like(cum_growth)
+  prev_growth[:, 1:] = cum_growth[:, :-1]
+  return cum_growth[:, -1], np.cumsum(withdraw / prev_growth, axis=1)
+
+
+def ruin_outcomes(start_value, withdrawal, final_growth, unit_spent, duration):
+  '''
+  Final balance and the index of the first year of ruin (-1 if none) from
+  decumulation factors. Growth is always positive, so a case is ruined from
+  the first year its discounted withdrawals exceed the start value and never
+  recovers.
+  '''
+  cases, width = unit_spent.shape
+  start_value = np.broadcast_to(np.asarray(start_value, dtype=np.float64), (cases,))
+  alive_year = np.arange(width) < duration[:, None]
+  spent = withdrawal * unit_spent
+  ruined = (spent >= start_value[:, None]) & alive_year
+  bankrupt = ruined.any(axis=1)
+  ruin_year = np.where(bankrupt, ruined.argmax(axis=1), -1)
+
+  balance = final_growth * (start_value - spent[:, -1])
+  outcome = np.where(bankrupt, 0, np.trunc(balance)).astype(np.int64)
+  return outcome, ruin_year
+
+
+def decumulate(start_value, withdrawal, returns_path, infl_path, duration):
+  '''
+  Withdraw inflation adjusted amount and grow the rest for every case using
+  cumulative products instead of a year by year loop.
+  Returns final balance and the index of the first year of ruin (-1 if none).
+  '''
+  final_growth, unit_spent = decumulation_factors(returns_path, infl_path, duration)
+  return ruin_outcomes(start_value, withdrawal, final_growth, unit_spent, duration)
+
+
+def retirement_outcomes(returns, infl_rate, start_value, withdrawal,
+                        start_year, duration, batch_size=BATCH_SIZE):
+  '''Run decumulation for all drawn cases in batches of bounded memory'''
+  num_cases = len(start_year)
+  outcome   = np.empty(num_cases, dtype=np.int64)
+  ruin_year = np.empty(num_cases, dtype=np.int64)
+  start_value = np.broadcast_to(np.asarray(start_value), (num_cases,))
+  width = max(int(duration.max()), 1) if num_cases else 1
+
+  # Lifespan is a sample of continuous piece of historic data. Selecting an
+  # interval at random is much better than selecting an individual year at
+  # random as it allows to use similar history for each asset class and also
+  # to catch important patterns, which are correlated between asset classes.
+  # Circular history wraps the index so that lifespan starts from the
+  # beginning and catches black swans that happened in the past (like two
+  # recession and great depression).
+  returns_hist = history.circular_history(returns, width)
+  infl_hist    = history.circular_history(infl_rate, width)
+
+  for lo in range(0, num_cases, batch_size):
+    hi = min(lo + batch_size, num_cases)
+    returns_path = history.windows(returns_hist, start_year[lo:hi], width)
+    infl_path    = history.windows(infl_hist, start_year[lo:hi] % len(infl_rate),
+                                   width)
+    outcome[lo:hi], ruin_year[lo:hi] = decumulate(start_value[lo:hi], withdrawal,
+                                                  returns_path, infl_path,
+                                                  duration[lo:hi])
+  return outcome, ruin_year
+
+
+def accumulate(returns, start_value, addition, start_year, duration,
+               batch_size=BATCH_SIZE):
+  '''Savings after adding addition and growing over sampled windows of years'''
+  num_cases = len(start_year)
+  savings   = np.empty(num_cases, dtype=np.int64)
+  width     = max(int(duration), 1)
+  returns_hist = history.circular_history(returns, width)
+  for lo in range(0, num_cases, batch_size):
+    hi = min(lo + batch_size, num_cases)
+    returns_path = history.windows(returns_hist, start_year[lo:hi], width)
+    growth, discount = accumulation_factors(returns_path, duration)
+    savings[lo:hi] = np.trunc(growth * (start_value + addition * discount))
+  return savings
+
+
+def pension_outcomes(returns, infl_rate, start_value, addition, work_start,
+                     work_years, withdrawal, retire_start, retire_duration,
+                     batch_size=BATCH_SIZE):
+  '''
+  Two phases of a pension for every case: savings with a yearly addition
+  over work_years from work_start, then withdrawals from the savings over the
+  retirement windows. Returns arrays of savings at retirement, final balance
+  and year of ruin (-1 if none).
+  '''
+  savings = accumulate(returns, start_value, addition, work_start, work_years,
+                       batch_size)
+  outcome, ruin_year = retirement_outcomes(returns, infl_rate, savings,
+                                           withdrawal, retire_start,
+                                           retire_duration, batch_size)
+  return savings, outcome, ruin_year
+
+
+def converged(stats, odds_width=ODDS_WIDTH, mean_width=MEAN_WIDTH, z=mc_stats.Z_95):
+  '''
+  True when the Wilson interval of ruin odds is at most odds_width either
+  side and the interval of the mean outcome at most mean_width of the mean
+  either side (None skips a check)
+  '''
+  if stats['count'] < 2:
+    return False
+  if odds_width is not None:
+    low, high = mc_stats.wilson_interval(stats, z)
+    if (high - low) / 2 > odds_width:
+      return False
+  if mean_width is not None:
+    low, high = mc_stats.mean_interval(stats, z)
+    if (high - low) / 2 > mean_width * abs(stats['mean']):
+      return False
+  return True
+
+
+def run_adaptive(simulate, stats, max_cases, odds_width=ODDS_WIDTH,
+                 mean_width=MEAN_WIDTH, batch_size=ADAPT_BATCH,
+                 z=mc_stats.Z_95, rng=None):
+  '''
+  Add batches of simulate(num_cases, rng) -> (outcome, ruined) to stats until
+  converged or max_cases ran. Odds near 0% or 100% and outcomes of low spread
+  stop after a few batches. Intervals take cases as independent, so with
+  stratified or antithetic sampling they are conservative. Returns stats.
+  '''
+  rng = np.random.default_rng(rng)
+  max_cases = int(max_cases)
+  while stats['count'] < max_cases:
+    size = min(batch_size, max_cases - stats['count'])
+    outcome, ruined = simulate(size, rng)
+    mc_stats.update_stats(stats, outcome, ruined)
+    if converged(stats, odds_width, mean_width, z):
+      break
+  return stats
+
+
+def hold_stats(returns, start_value, low, high, mode, max_cases, outcome_range,
+               truncate=False, odds_width=ODDS_WIDTH, mean_width=MEAN_WIDTH,
+               rng=None):
+  '''
+  Statistics of start_value held over windows of circular daily history with
+  triangular durations from low to high. A short history is enumerated, every
+  (start day, duration) pair once with its probability. Daily history has too
+  many pairs and is sampled in batches until odds and mean are as precise as
+  asked for, max_cases being only the cap. Ruin is an outcome below
+  start_value. Outcomes up to outcome_range times start_value are binned by
+  whole units, so quantiles of whole outcomes are exact.
+  '''
+  # Mode beyond high stretches durations past it
+  hist = history.circular_history(returns, max_duration(low, high, mode))
+  upper = outcome_range * start_value
+  stats = mc_stats.start_stats(0, upper, upper)
+
+  cases = enumerate_cases(len(returns), low, high, mode)
+  if cases is not None:
+    start_day, duration, weight = cases
+    outcome = hold_outcomes(hist, start_day, duration, start_value, truncate)
+    mc_stats.update_stats(stats, outcome, outcome < start_value,
+                          weight * len(weight))
+    stats['exact'] = True
+    return stats
+
+  def simulate(num_cases, rng):
+    start_day, duration = draw_cases(len(returns), num_cases, low, high, mode,
+                                     rng)
+    outcome = hold_outcomes(hist, start_day, duration, start_value, truncate)
+    return outcome, outcome < start_value
+
+  return run_adaptive(simulate, stats, max_cases, odds_width, mean_width,
+                      rng=rng)
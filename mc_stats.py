@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+
+import numpy as np
+
+HIST_BINS = 4096
+Z_95      = 1.959963984540054 # Normal quantile of two sided 95% intervals
+
+
+def start_stats(low=None, high=None, bins=HIST_BINS):
+  '''
+  Empty accumulator of outcome statistics: count, ruin count, min, max, mean
+  and sum of squared deviations. Statistics of exact enumeration are marked
+  'exact' and have no sampling error. With a range from low to high it also keeps
+  a histogram of equal bins plus one bin below and one above the range, with
+  the count and sum of outcomes of every bin, to read quantiles and tail means
+  without keeping the outcomes.
+  '''
+  stats = {'count': 0,
+           'ruined': 0,
+           'min': np.inf,
+           'max': -np.inf,
+           'mean': 0.0,
+           'm2': 0.0,
+           'exact': False,
+           'edges': None,
+           'counts': None,
+           'sums': None}
+  if low is not None:
+    stats['edges'] = np.linspace(float(low), float(high), int(bins) + 1)
+    stats['counts'] = np.zeros(int(bins) + 2)
+    stats['sums'] = np.zeros(int(bins) + 2)
+  return stats
+
+
+def merge_moments(stats, count, mean, m2):
+  '''Chan et al. update of mean and squared deviations with another group'''
+  total = stats['count'] + count
+  if count == 0:
+    return
+  delta = mean - stats['mean']
+  stats['m2'] += m2 + delta ** 2 * stats['count'] * count / total
+  stats['mean'] += delta * count / total
+  stats['count'] = total
+
+
+def update_stats(stats, outcome, ruined=None, weights=None):
+  '''
+  Add a batch of outcomes and their boolean ruin flags to the accumulator.
+  Batch moments are merged with the running ones, so memory does not grow
+  with the number of cases.
+  weights -- number of cases every outcome stands for, e.g. probabilities of
+             enumerated cases scaled to their count, 1 each by default
+  '''
+  outcome = np.asarray(outcome, dtype=np.float64).ravel()
+  if weights is not None:
+    weights = np.asarray(weights, dtype=np.float64).ravel()
+    outcome = outcome[weights > 0]
+    ruined  = None if ruined is None else np.asarray(ruined).ravel()[weights > 0]
+    weights = weights[weights > 0]
+  if len(outcome) == 0:
+    return stats
+  if weights is None:
+    if ruined is not None:
+      stats['ruined'] += int(np.count_nonzero(ruined))
+    count = len(outcome)
+    mean  = np.mean(outcome)
+    m2    = float(np.sum((outcome - mean) ** 2))
+  else:
+    if ruined is not None:
+      stats['ruined'] += float(np.sum(weights[np.asarray(ruined, dtype=bool)]))
+    count = float(np.sum(weights))
+    mean  = np.sum(weights * outcome) / count
+    m2    = float(np.sum(weights * (outcome - mean) ** 2))
+  stats['min'] = min(stats['min'], float(np.min(outcome)))
+  stats['max'] = max(stats['max'], float(np.max(outcome)))
+  merge_moments(stats, count, mean, m2)
+
+  if stats['edges'] is not None:
+    edges = stats['edges']
+    bins  = len(edges) - 1
+    width = (edges[-1] - edges[0]) / bins
+    # Bin 0 is below the range and bin bins + 1 is above it
+    index = np.floor((outcome - edges[0]) / width).astype(np.int64) + 1
+    index = np.clip(index, 0, bins + 1)
+    index[outcome >= edges[-1]] = bins + 1
+    stats['counts'] += np.bincount(index, weights=weights, minlength=bins + 2)
+    stats['sums'] += np.bincount(index, weights=outcome if weights is None
+                                 else weights * outcome, minlength=bins + 2)
+  return stats
+
+
+def merge_stats(first, second):
+  '''Accumulator of both groups of cases, e.g. of chunks run by workers'''
+  merged = start_stats()
+  merged['ruined'] = first['ruined'] + second['ruined']
+  merged['exact'] = first['exact'] and second['exact']
+  merged['min'] = min(first['min'], second['min'])
+  merged['max'] = max(first['max'], second['max'])
+  merged['count'], merged['mean'], merged['m2'] = (first['count'],
+                                                   first['mean'], first['m2'])
+  merge_moments(merged, second['count'], second['mean'], second['m2'])
+  if first['edges'] is not None:
+    if second['edges'] is None or not np.array_equal(first['edges'],
+                                                     second['edges']):
+      raise ValueError('Histograms of merged statistics have different bins')
+    merged['edges'] = first['edges']
+    merged['counts'] = first['counts'] + second['counts']
+    merged['sums'] = first['sums'] + second['sums']
+  return merged
+
+
+def tail_rank(stats, q):
+  '''Bin holding the case of rank ceil(q * count) and its rank within the bin'''
+  if stats['edges'] is None:
+    raise ValueError('Quantiles need statistics started with a range')
+  if stats['count'] == 0:
+    raise ValueError('Quantiles of empty statistics')
+  rank = min(max(int(np.ceil(round(q * stats['count'], 6))), 1), stats['count'])
+  cum_counts = np.cumsum(stats['counts'])
+  index = min(int(np.searchsorted(cum_counts, rank)), len(cum_counts) - 1)
+  return index, rank - (cum_counts[index] - stats['counts'][index])
+
+
+def bin_bounds(stats, index):
+  '''Edges of a bin, bins outside the range end at the min and max outcome'''
+  edges = stats['edges']
+  if index == 0:
+    return stats['min'], edges[0]
+  if index == len(edges):
+    return edges[-1], stats['max']
+  return edges[index - 1], edges[index]
+
+
+def quantile(stats, q):
+  '''
+  Outcome of rank ceil(q * count) counted from the smallest, the element a
+  sorted list of outcomes has at that rank. Cases of a bin are taken as
+  evenly spread from its lower edge, so the error is below one bin width and
+  a bin of width one over whole outcomes gives the exact value. Outside the
+  range cases are spread between the range and the min or max outcome, which
+  is rough, so the range should cover the quantiles of interest.
+  '''
+  index, rank = tail_rank(stats, q)
+  low, high = bin_bounds(stats, index)
+  return low + (high - low) * max(rank - 1, 0) / stats['counts'][index]
+
+
+def tail_mean(stats, q):
+  '''
+  Mean of the ceil(q * count) smallest outcomes (CVaR of the outcome). Bins
+  below the quantile add their exact sums, the bin of the quantile adds its
+  mean for every case taken from it.
+  '''
+  index, rank = tail_rank(stats, q)
+  counts, sums = stats['counts'], stats['sums']
+  total = np.sum(sums[:index]) + rank * sums[index] / counts[index]
+  return total / (np.sum(counts[:index]) + rank)
+
+
+def pair_means(values, sampling='random'):
+  '''
+  Values as independent samples for standard errors: means of antithetic
+  pairs of draw_uniform, values themselves otherwise. Stratified cases are
+  taken as independent, which overstates their error.
+  '''
+  values = np.asarray(values, dtype=np.float64)
+  if sampling != 'antithetic':
+    return values
+  paired = len(values) - len(values) % 2
+  return np.concatenate([(values[:paired:2] + values[1:paired:2]) / 2,
+                         values[paired:]])
+
+
+def standard_error(stats):
+  '''Standard error of the mean of independent samples added to stats'''
+  if stats['exact']:
+    return 0.0
+  count = stats['count']
+  return np.sqrt(stats['m2'] / (count - 1) / count) if count > 1 else np.nan
+
+
+def mean_error(values, sampling='random'):
+  '''Standard error of the mean of per case values drawn with sampling'''
+  return standard_error(update_stats(start_stats(), pair_means(values, sampling)))
+
+
+def wilson_interval(stats, z=Z_95):
+  '''
+  Wilson score interval of the probability of ruin. Unlike the normal one it
+  stays inside [0, 1] and is narrow, not empty, when no case or every case
+  is ruined.
+  '''
+  count = stats['count']
+  if count == 0:
+    return 0.0, 1.0
+  p = stats['ruined'] / count
+  if stats['exact']:
+    return p, p
+  scale  = 1 + z ** 2 / count
+  center = (p + z ** 2 / (2 * count)) / scale
+  half   = z * np.sqrt(p * (1 - p) / count + z ** 2 / (4 * count ** 2)) / scale
+  return max(center - half, 0.0), min(center + half, 1.0)
+
+
+def mean_interval(stats, z=Z_95):
+  '''Normal interval of the mean outcome'''
+  half = z * standard_error(stats)
+  return stats['mean'] - half, stats['mean'] + half
+
+
+def summary(stats):
+  '''Count, ruin count, odds of ruin in percent, min, mean, std and max'''
+  count = stats['count']
+  return {'count': count,
+          'ruined': stats['ruined'],
+          'odds': round(100 * stats['ruined'] / count, 1) if count else 0.0,
+          'min': stats['min'],
+          'mean': stats['mean'],
+          'std': np.sqrt(stats['m2'] / (count - 1)) if count > 1 else 0.0,
+          'max': stats['max']}
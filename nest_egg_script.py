@@ -2,14 +2,16 @@
 
 import time
 import sys
-import random
+import numpy as np
+import history
+import mc_engine
+import mc_stats
 import matplotlib.pyplot as plt
 
-def read_to_list(file_name):
-  with open(file_name) as in_file:
-    lines   = [float(line.strip()) for line in in_file]
-    decimal = [round(line / 100, 5) for line in lines]
-    return decimal
+SAMPLING   = 'stratified' # Sampling of cases, one of mc_engine.SAMPLING
+ODDS_WIDTH = 0.005 # Stop when ruin odds are known within this either side
+MEAN_WIDTH = 0.01  # Same for mean outcome, relative to the mean
+EXACT      = True  # Run every start year and duration once instead of sampling
 
 def default_input(prompt, default=None):
   prompt = '{} [{}]: '.format(prompt, default)
@@ -21,11 +23,11 @@ def default_input(prompt, default=None):
 
 print("\nNote: Input data should be in percent, not decimal!\n")
 try:
-  bonds = read_to_list('10-yr_TBond_returns_1926-2013_pct.txt')
-  stocks = read_to_list('SP500_returns_1926-2013_pct.txt')
-  blend_40_50_10 = read_to_list('S-B-C_blend_1926-2013_pct.txt')
-  blend_50_50 = read_to_list('S-B_blend_1926-2013_pct.txt')
-  infl_rate = read_to_list('annual_infl_rate_1926-2013_pct.txt')
+  bonds = history.load_returns('10-yr_TBond_returns_1926-2013_pct.txt')
+  stocks = history.load_returns('SP500_returns_1926-2013_pct.txt')
+  blend_40_50_10 = history.load_returns('S-B-C_blend_1926-2013_pct.txt')
+  blend_50_50 = history.load_returns('S-B_blend_1926-2013_pct.txt')
+  infl_rate = history.load_returns('annual_infl_rate_1926-2013_pct.txt')
 except IOError as e:
   print("{}. \nTerminating program.".format(e), file=sys.stderr)
   sys.exit(1)
@@ -65,7 +67,7 @@ max_years = default_input("Input maximum years in retirement: \n", '40')
 while not max_years.isdigit():
   max_years = input("Invalid input! Input integer only: ")
 
-num_cases = default_input("Input number of cases to run: \n", '50000')
+num_cases = default_input("Input maximum number of cases to run: \n", '50000')
 while not num_cases.isdigit():
   num_cases = input("Invalid input! Input integer only: ")
 
@@ -77,67 +79,78 @@ if not int(min_years) < int(most_likely_years) < int(max_years) or int(max_years
 
 
 # Randomly determine starting year as a part of Monte Carlo engine
-def montecarlo(returns):
-  case_count = 0
-  bankrupt_count = 0
-  outcome = []
-  
-  while case_count < int(num_cases):
-    investments = int(start_value)
-    start_year  = random.randrange(0, len(returns))
-    duration    = int(random.triangular(int(min_years), 
-                                        int(max_years), 
-                                        int(most_likely_years)))
-    end_year = start_year + duration
-    # Lifespan is a sample of continuous piece of historic data. Selecting an
-    # interval at random is much better than selecting an individual year at
-    # random as it allows to use similar history for each asset class and also
-    # to catch important patterns. Catching the same behaviour for different
-    # asset classes is important as financial markets have similar bull or
-    # bear behaviour -- i.e. they are correlated.
-    lifespan = [i for i in range(start_year, end_year)]
-    bankrupt = 'no'
-
-    lifespan_returns = []
-    lifespan_infl    = []
-    for i in lifespan:
-      # If lifespan index is out of range (88 years or more) use % to wrap index
-      # It is important to wrap index around because then index starts from the
-      # beginning and catches black swans that happened in the past (like two
-      # recession and great depression). Modulo operator allows to use the lists
-      # as infinite loops.
-      lifespan_returns.append(returns[i % len(returns)])
-      lifespan_infl.append(infl_rate[i % len(infl_rate)])
-    
-    # Loop each year of retirement for each case run and adjust investments
-    for index, i in enumerate(lifespan_returns):
-      infl = lifespan_infl[index]
-      if index == 0:
-        withdraw_infl_adj = int(withdrawal)
+def montecarlo(returns_by_type):
+  '''
+  Outcome statistics of every investment type of returns_by_type. All types
+  run on the same cases (common random numbers), so their odds differ by the
+  type and not by the draws. Cases run in batches of bounded memory and only
+  their statistics are kept: outcome statistics per type, ruin flags per type
+  and their differences from the chosen type, the last two as independent
+  samples for standard errors. With EXACT every (start year, duration) pair
+  runs once instead, weighted by its probability.
+  '''
+  names = list(returns_by_type)
+  stats  = {name: mc_stats.start_stats() for name in names}
+  ruin   = {name: mc_stats.start_stats() for name in names}
+  change = {name: mc_stats.start_stats() for name in names}
+  n_years = len(returns_by_type[names[0]])
+
+  def add_cases(start_year, duration, weights=None):
+    ruined = {}
+    for name in names:
+      outcome, ruin_year = mc_engine.retirement_outcomes(returns_by_type[name],
+                                                         infl_rate,
+                                                         int(start_value),
+                                                         int(withdrawal),
+                                                         start_year, duration)
+      ruined[name] = (ruin_year >= 0).astype(np.float64)
+      mc_stats.update_stats(stats[name], outcome, ruin_year >= 0, weights)
+    base = ruined[invest_type]
+    for name in names:
+      if weights is None:
+        mc_stats.update_stats(ruin[name], mc_stats.pair_means(ruined[name],
+                                                              SAMPLING))
+        mc_stats.update_stats(change[name],
+                              mc_stats.pair_means(ruined[name] - base, SAMPLING))
       else:
-        withdraw_infl_adj = int(withdraw_infl_adj * (1 + infl))
-      
-      investments -= withdraw_infl_adj
-      investments = int(investments * (1 + i))
-
-      if investments <= 0:
-        bankrupt = 'yes'
-        break
-    
-    if bankrupt == 'yes':
-      outcome.append(0)
-      bankrupt_count += 1
-    else:
-      outcome.append(investments)
-    case_count += 1
-
-  return outcome, bankrupt_count
+        mc_stats.update_stats(ruin[name], ruined[name], weights=weights)
+        mc_stats.update_stats(change[name], ruined[name] - base,
+                              weights=weights)
+
+  cases = None
+  if EXACT:
+    cases = mc_engine.enumerate_cases(n_years, int(min_years), int(max_years),
+                                      int(most_likely_years))
+  if cases is not None:
+    start_year, duration, weight = cases
+    add_cases(start_year, duration, weight * len(weight))
+    for group in (stats, ruin, change):
+      for name in names:
+        group[name]['exact'] = True
+    return stats, ruin, change
+
+  rng = np.random.default_rng()
+  # Batches run until odds and mean outcome of every type are as precise as
+  # asked for, the number of cases input is only the cap
+  for lo in range(0, int(num_cases), mc_engine.ADAPT_BATCH):
+    size = min(mc_engine.ADAPT_BATCH, int(num_cases) - lo)
+    start_year, duration = mc_engine.draw_cases(n_years, size,
+                                                int(min_years), int(max_years),
+                                                int(most_likely_years), rng,
+                                                SAMPLING)
+    add_cases(start_year, duration)
+    if all(mc_engine.converged(stats[name], ODDS_WIDTH, MEAN_WIDTH)
+           for name in names):
+      break
+  return stats, ruin, change
 
 
 # Compute probability of ruin
-def bankrupt_prob(outcome, bankrupt_count):
-  total = len(outcome)
-  odds  = round(100 * bankrupt_count / total, 1)
+def bankrupt_prob(stats, ruin):
+  result = mc_stats.summary(stats)
+  odds = result['odds']
+  odds_se = round(100 * mc_stats.standard_error(ruin), 2)
+  odds_low, odds_high = mc_stats.wilson_interval(stats)
 
   print("\nInvestment type: {}".format(invest_type))
   print("Start value: ${:,}".format(int(start_value)))
@@ -145,19 +158,41 @@ def bankrupt_prob(outcome, bankrupt_count):
   print("Years in retirement (min-ml-max): {}-{}-{}".format(min_years,
                                                             most_likely_years,
                                                             max_years))
-  print("Number of runs: {:,}\n".format(len(outcome)))
-  print("Odds of ruin: {}%\n".format(odds))
-  print("Average outcome: ${:,}".format(int(sum(outcome) / total)))
-  print("Minimum outcome: ${:,}".format(min(i for i in outcome)))
-  print("Maximum outcome: ${:,}".format(max(i for i in outcome)))
+  if stats['exact']:
+    print("Number of runs: {:,} (every start year and duration)\n".format(
+      int(result['count'])))
+    print("Odds of ruin: {}% (exact)\n".format(odds))
+  else:
+    print("Number of runs: {:,}\n".format(result['count']))
+    print("Odds of ruin: {}% (standard error {}%, ".format(odds, odds_se) +
+          "95% interval {:.1f}-{:.1f}%)\n".format(100 * odds_low, 100 * odds_high))
+  print("Average outcome: ${:,}".format(int(result['mean'])))
+  print("Minimum outcome: ${:,}".format(int(result['min'])))
+  print("Maximum outcome: ${:,}".format(int(result['max'])))
   
   return odds
 
 
+def compare_types(stats, ruin, change):
+  '''Odds of all investment types and the error of their change from the chosen one'''
+  print("\nOdds of ruin of all types on the same cases, change from {}:".format(
+    invest_type))
+  for name in stats:
+    print("{:>10}: {:5.1f}% (SE {:.2f}%), change {:+5.1f}% (SE {:.2f}%)".format(
+      name, 100 * ruin[name]['mean'], 100 * mc_stats.standard_error(ruin[name]),
+      100 * change[name]['mean'], 100 * mc_stats.standard_error(change[name])))
+
+
 def main():
-  outcome, bankrupt_count = montecarlo(investment_type_args[invest_type])
-  odds = bankrupt_prob(outcome, bankrupt_count)
-  plotdata = outcome[:3000]
+  # python nest_egg_script.py compare -- run all investment types side by side
+  if 'compare' in sys.argv[1:]:
+    returns_by_type = investment_type_args
+  else:
+    returns_by_type = {invest_type: investment_type_args[invest_type]}
+  stats, ruin, change = montecarlo(returns_by_type)
+  odds = bankrupt_prob(stats[invest_type], ruin[invest_type])
+  if len(returns_by_type) > 1:
+    compare_types(stats, ruin, change)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,115 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+METHODS = ('zscore', 'mad', 'iqr')
+MAD_SCALE = 1.4826 # Makes MAD a consistent estimate of sigma of normal data
+
+
+def checkMethod(method):
+  if method not in METHODS:
+    raise ValueError('Unknown outlier method: {}'.format(method))
+
+def outlierStats(values, method, axis=None):
+  """
+  Center and scale of values for the method along axis: mean and standard
+  deviation for 'zscore' (zero deviation scales by 1 as StandardScaler does),
+  median and scaled MAD for 'mad', quartiles for 'iqr'. MAD is zero when more
+  than half of the values are the same, then the standard deviation scales
+  instead, so that not every other value is an outlier.
+  """
+  checkMethod(method)
+  if method == 'zscore':
+    center = np.mean(values, axis=axis)
+    scale  = np.std(values, axis=axis)
+    return center, np.where(scale > 0, scale, 1.0)
+  if method == 'mad':
+    center = np.median(values, axis=axis)
+    spread = np.abs(values - (center if axis is None else np.expand_dims(center, axis)))
+    scale  = MAD_SCALE * np.median(spread, axis=axis)
+    std    = np.std(values, axis=axis)
+    return center, np.where(scale > 0, scale, np.where(std > 0, std, 1.0))
+  return np.quantile(values, 0.25, axis=axis), np.quantile(values, 0.75, axis=axis)
+
+def flagOutliers(values, stats, limit, method):
+  """Boolean mask of values outside limit of the stats of outlierStats"""
+  first, second = stats
+  if method == 'iqr':
+    iqr = second - first
+    return (values < first - limit * iqr) | (values > second + limit * iqr)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return np.abs(values - first) / second > limit
+
+def outlierMask(values, limit, method='zscore'):
+  """Boolean mask of outliers against statistics of the whole series"""
+  values = np.asarray(values, dtype=np.float64)
+  return flagOutliers(values, outlierStats(values, method), limit, method)
+
+def rollingOutliers(values, window, limit, method='zscore'):
+  """
+  Causal outlier mask and replacement values. Day t is judged against the
+  window days before it, never against itself or later days, and would be
+  replaced by the median of those days. Days with less than a full window of
+  history are never flagged.
+  Returns mask and array of replacements (nan where there is no window).
+  """
+  values  = np.asarray(values, dtype=np.float64)
+  mask    = np.zeros(len(values), dtype=bool)
+  replace = np.full(len(values), np.nan)
+  if len(values) <= window:
+    return mask, replace
+  past  = sliding_window_view(values, window)[:-1]
+  stats = outlierStats(past, method, axis=1)
+  mask[window:]    = flagOutliers(values[window:], stats, limit, method)
+  replace[window:] = stats[0] if method == 'mad' else np.median(past, axis=1)
+  return mask, replace
+
+def removeOutliers(returns, sigma_limit, method='zscore', window=None):
+  """
+  Replace outliers of returns with the median. By default outliers are
+  standardized returns beyond sigma_limit of the whole series, replaced by
+  the median of the series.
+  window -- days of causal rolling statistics, outliers are judged against
+            and replaced by the median of the days before them only
+  """
+  returns = np.asarray(returns, dtype=np.float64)
+  if window is None:
+    mask    = outlierMask(returns, sigma_limit, method)
+    replace = np.median(returns)
+  else:
+    mask, replace = rollingOutliers(returns, window, sigma_limit, method)
+  return np.where(mask, replace, returns).tolist()
+
+def startOutliers(history, window, limit, method='zscore'):
+  """
+  State for cleaning new days one at a time with the same rule as
+  rollingOutliers, seeded with the latest window days of raw history.
+  """
+  checkMethod(method)
+  history = np.asarray(history, dtype=np.float64)[-window:]
+  buffer  = np.zeros(window)
+  buffer[:len(history)] = history
+  return {'window': window,
+          'limit': limit,
+          'method': method,
+          'buffer': buffer,
+          'pos': len(history) % window,
+          'count': len(history)}
+
+def updateOutliers(state, value):
+  """
+  Judge a new day against the window before it and put the raw value in
+  place of the oldest day. Returns the cleaned value and outlier flag.
+  """
+  buffer = state['buffer']
+  outlier, cleaned = False, value
+  if state['count'] >= state['window']:
+    stats   = outlierStats(buffer, state['method'])
+    outlier = bool(flagOutliers(np.float64(value), stats, state['limit'],
+                                state['method']))
+    if outlier:
+      cleaned = float(stats[0] if state['method'] == 'mad' else np.median(buffer))
+  # Statistics do not depend on order, so the window is a ring buffer
+  buffer[state['pos']] = value
+  state['pos']    = (state['pos'] + 1) % state['window']
+  state['count'] += 1
+  return cleaned, outlier
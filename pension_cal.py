@@ -1,7 +1,12 @@
 import time
 import sys
-import random
+import numpy as np
 import pandas as pd
+import history
+import mc_engine
+import mc_stats
+import sweep
+from concurrent.futures import ProcessPoolExecutor
 
 SAVINGS = [1200, 2400, 3600, 4800, 6000, 7200, 8400, 9600, 10800, 12000, 13200, 16800]
 START_SAVINGS = 10000
@@ -11,110 +16,268 @@ MIN_YR = 16
 MAX_YR = 35
 MED_YR = 22
 WITHDRAWAL = 45000
+RETIRE_AGE = 65
+AGES        = list(range(25, 61, 5))           # CURRENT_AGE grid of the sweep
+WITHDRAWALS = list(range(20000, 80001, 5000))  # WITHDRAWAL grid of the sweep
+SEED    = None # Master seed of the sweep, set an int to reproduce results
+WORKERS = None # Number of processes, None uses all cores
+COMMON   = True         # Run every scenario on the same cases
+SAMPLING = 'stratified' # Sampling of cases, one of mc_engine.SAMPLING
+ADAPTIVE = True         # Run a scenario only until its odds are precise
+EXACT    = True         # Run every start year and duration once, no sampling
 
-def read_to_list(file_name):
-  with open(file_name) as in_file:
-    lines = [float(line.strip()) for line in in_file]
-    decimal = [round(line / 100, 5) for line in lines]
-    return decimal
-
-
-def montecarlo(returns, inflation, saving):
-  case_count = 0
-  bankrupt_count = 0
-  outcome = []
-
-  while case_count < int(NUM_CASES):
-    # Part I: simulation of savings during work time
-    savings = int(START_SAVINGS)
-
-    # Start year of savings is different from the same of investments as those
-    # activities happen in a different periods (i.e. investments satrt after
-    # retirement)
-    start_year = random.randrange(0, len(returns))
-    duration   = 65 - CURRENT_AGE
-    end_year   = start_year + duration
-
-    worktime = [i for i in range(start_year, end_year)]
-    worktime_returns   = []
-    worktime_inflation = []
-
-    for i in worktime:
-      worktime_returns.append(returns[i % len(returns)])
-      worktime_inflation.append(inflation[i % len(inflation)])
-
-    for index, i in enumerate(worktime_returns):
-      infl = worktime_inflation[index]
-      if index == 0:
-        addition_inf_adj = int(saving)
-      else:
-        addition_inf_adj = int(addition_inf_adj * (1 + infl))
-      # Try without inflation
-      addition_inf_adj = int(saving)
-      savings += addition_inf_adj
-      savings = int(savings * (1 + i))
-
-    # Part II: simulation of retirement evolution
-    start_year  = random.randrange(0, len(returns))
-    duration    = int(random.triangular(MIN_YR, MAX_YR, MED_YR))
-    end_year    = start_year + duration
-    investments = savings
-
-    lifespan = [i for i in range(start_year, end_year)]
-    bankrupt = 'no'
-
-    lifespan_returns = []
-    lifespan_infl = []
-
-    for i in lifespan:
-      lifespan_returns.append(returns[i % len(returns)])
-      lifespan_infl.append(inflation[i % len(inflation)])
-
-    for index, i in enumerate(lifespan_returns):
-      infl = lifespan_infl[index]
-      if index == 0:
-        withdraw_infl_adj = int(WITHDRAWAL)
-      else:
-        withdraw_infl_adj = int(withdraw_infl_adj * (1 + infl))
-      investments -= withdraw_infl_adj
-      investmetns = int(investments * (1 + i))
-
-      if investments <= 0:
-        bankrupt = 'yes'
-        break
-    if bankrupt == 'yes':
-      outcome.append(0)
-      bankrupt_count += 1
-    else:
-      outcome.append(investments)
-    case_count += 1
-  return outcome, bankrupt_count, savings
+def montecarlo(returns, inflation, saving, current_age=CURRENT_AGE,
+               withdrawal=WITHDRAWAL, num_cases=NUM_CASES, rng=None,
+               sampling=SAMPLING):
+  """
+  Savings during work time and their evolution in retirement for all cases
+  at once. Start years of both phases are drawn independently, as those
+  activities happen in different periods. Returns dict of per case arrays
+  'savings' at retirement, final 'outcome' and 'ruin year' (-1 if none).
+  """
+  # Draw all random numbers of the run up front from one generator, so that a
+  # chunk of cases is fully defined by its seed
+  rng = np.random.default_rng(rng)
+  work_start = mc_engine.draw_starts(len(returns), num_cases, rng, sampling)
+  retire_start, retire_duration = mc_engine.draw_cases(len(returns), num_cases,
+                                                       MIN_YR, MAX_YR, MED_YR,
+                                                       rng, sampling)
+  savings, outcome, ruin_year = mc_engine.pension_outcomes(
+    returns, inflation, START_SAVINGS, saving, work_start,
+    RETIRE_AGE - current_age, withdrawal, retire_start, retire_duration)
+  return {'savings': savings, 'outcome': outcome, 'ruin year': ruin_year}
 
 
-def bankrupt_prob(outcome, bankrupt_count, saving, start_value):
+def bankrupt_prob(run, saving, sampling=SAMPLING):
+  outcome = run['outcome']
   total = len(outcome)
-  odds  = round(100 * bankrupt_count / total, 1)
+  ruined = run['ruin year'] >= 0
+  odds  = round(100 * int(np.sum(ruined)) / total, 1)
+  odds_se = round(100 * mc_stats.mean_error(ruined, sampling), 2)
 
   result = {'Savings': int(saving),
-            'Start value': int(start_value),
+            'Start value': int(np.mean(run['savings'])),
             'Odds': odds,
-            'Min': min(i for i in outcome),
-            'Avg': int(sum(outcome) / total),
-            'Max': max(i for i in outcome)}
+            'Odds SE': odds_se,
+            'Min': int(np.min(outcome)),
+            'Avg': int(np.sum(outcome) / total),
+            'Max': int(np.max(outcome))}
   
   return result
 
 
-def main():
-  returns   = read_to_list('SP500_returns_1926-2023_pct.txt')
-  inflation = read_to_list('annual_infl_rate_1926-2023_pct.txt')
+def combine_chunks(chunks):
+  '''Join per case arrays of chunks of one scenario in the order of their seeds'''
+  return {key: np.concatenate([chunk[key] for chunk in chunks])
+          for key in chunks[0]}
+
+
+def scenario_outcomes(growth, discount, final_growth, total_spent, retired,
+                      saving, withdrawal):
+  '''
+  Savings at retirement, ruin flags and final balances of one saving and
+  withdrawal from accumulation and decumulation factors of the cases.
+  Discounted withdrawals only grow, so a case is ruined if their total is
+  above the start value. Factors of work and retirement broadcast against
+  each other, e.g. as a column and a row to pair every work start with every
+  retirement case.
+  '''
+  start_value = np.trunc(growth * (START_SAVINGS + saving * discount))
+  spent    = withdrawal * total_spent
+  bankrupt = (spent >= start_value) & retired
+  outcome  = np.where(bankrupt, 0, np.trunc(final_growth * (start_value - spent)))
+  return start_value, bankrupt, outcome
+
+
+def exact_run(returns, inflation, saving, current_age=CURRENT_AGE,
+              withdrawal=WITHDRAWAL):
+  '''
+  Statistics of outcome and of savings at retirement of one saving level
+  over every work start year paired with every retirement (start year,
+  duration), weighted by their probabilities. Phases only meet through the
+  savings, so the pairs come from one pass of factors over each phase.
+  Returns None if there are too many retirement pairs to enumerate.
+  '''
+  cases = mc_engine.enumerate_cases(len(returns), MIN_YR, MAX_YR, MED_YR)
+  if cases is None:
+    return None
+  retire_start, retire_duration, weight = cases
+  n_years    = len(returns)
+  work_years = RETIRE_AGE - current_age
+  width = max(int(retire_duration.max()), 1)
+  returns_hist = history.circular_history(returns, max(width, work_years, 1))
+  infl_hist    = history.circular_history(inflation, width)
+  work_path = history.windows(returns_hist, np.arange(n_years),
+                              max(work_years, 1))
+  growth, discount = mc_engine.accumulation_factors(work_path, work_years)
+  final_growth, unit_spent = mc_engine.decumulation_factors(
+    history.windows(returns_hist, retire_start, width),
+    history.windows(infl_hist, retire_start % len(inflation), width),
+    retire_duration)
+
+  start_value, bankrupt, outcome = scenario_outcomes(
+    growth[:, None], discount[:, None], final_growth, unit_spent[:, -1],
+    retire_duration > 0, saving, withdrawal)
+  # Weights count every pair as one case with its probability relative to
+  # uniform pairs
+  weights = np.broadcast_to(weight / n_years, outcome.shape) * outcome.size
+  stats = mc_stats.update_stats(mc_stats.start_stats(), outcome, bankrupt,
+                                weights)
+  savings = mc_stats.update_stats(mc_stats.start_stats(), start_value[:, 0])
+  stats['exact'] = savings['exact'] = True
+  stats['pairs'] = outcome.size
+  return stats, savings
+
+
+def interval_table(levels, runs):
+  '''
+  Table of statistics of saving levels with 95% intervals and cases run, or
+  with the number of (work start, retirement start, duration) combinations
+  evaluated as 'Pairs' for exact runs
+  '''
   results = []
-  for saving in SAVINGS:
-    outcome, bankrupt_count, start_value = montecarlo(returns, inflation, saving)
-    odds = bankrupt_prob(outcome, bankrupt_count, saving, start_value)
-    results.append(odds)
-  output_dt = pd.DataFrame(results)
-  print(output_dt)
+  for saving, (stats, savings) in zip(levels, runs):
+    odds_low, odds_high = mc_stats.wilson_interval(stats)
+    avg_low, avg_high = mc_stats.mean_interval(stats)
+    if stats['exact']:
+      cases = ('Pairs', int(stats['pairs']))
+    else:
+      cases = ('Cases', int(stats['count']))
+    results.append({'Savings': int(saving),
+                    cases[0]: cases[1],
+                    'Start value': int(savings['mean']),
+                    'Odds': round(100 * stats['ruined'] / stats['count'], 1),
+                    'Odds low': round(100 * odds_low, 1),
+                    'Odds high': round(100 * odds_high, 1),
+                    'Min': int(stats['min']),
+                    'Avg': int(stats['mean']),
+                    'Avg low': int(avg_low),
+                    'Avg high': int(avg_high),
+                    'Max': int(stats['max'])})
+  return pd.DataFrame(results)
+
+
+def adaptive_run(returns, inflation, saving, seed):
+  '''
+  Statistics of outcome and of savings at retirement of one saving level,
+  run in batches until the odds and mean outcome converge or NUM_CASES ran
+  '''
+  savings = mc_stats.start_stats()
+
+  def simulate(num_cases, rng):
+    run = montecarlo(returns, inflation, saving, num_cases=num_cases, rng=rng)
+    mc_stats.update_stats(savings, run['savings'])
+    return run['outcome'], run['ruin year'] >= 0
+
+  stats = mc_engine.run_adaptive(simulate, mc_stats.start_stats(), NUM_CASES,
+                                 rng=seed)
+  return stats, savings
+
+
+def adaptive_sweep(returns, inflation, levels, seed=SEED, workers=WORKERS):
+  '''
+  adaptive_run of every saving level in a process pool. With COMMON every
+  level starts from the same seed and so runs the same cases as far as it
+  goes. Returns DataFrame of the levels with cases run and 95% intervals.
+  '''
+  master = np.random.SeedSequence(seed)
+  seeds  = [master] * len(levels) if COMMON else master.spawn(len(levels))
+  args   = [(returns, inflation, saving, s) for saving, s in zip(levels, seeds)]
+  if workers == 1:
+    runs = [adaptive_run(*a) for a in args]
+  else:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      runs = list(pool.map(adaptive_run, *zip(*args)))
+
+  return interval_table(levels, runs)
+
+
+def grid_sweep(returns, inflation, ages, savings, withdrawals,
+               num_cases=NUM_CASES, seed=SEED, sampling=SAMPLING):
+  '''
+  Odds and outcomes of every (current age, saving, withdrawal) scenario. All
+  scenarios share one set of drawn cases. Savings and withdrawal enter the
+  balances linearly, so growth factors of work windows are computed once per
+  age and decumulation factors once for the whole grid, leaving a few vector
+  operations per scenario.
+  '''
+  rng = np.random.default_rng(seed)
+  num_cases  = int(num_cases)
+  work_start = mc_engine.draw_starts(len(returns), num_cases, rng, sampling)
+  retire_start, retire_duration = mc_engine.draw_cases(len(returns), num_cases,
+                                                       MIN_YR, MAX_YR, MED_YR,
+                                                       rng, sampling)
+  width = max(int(retire_duration.max()), 1)
+  max_work = max(max(RETIRE_AGE - age for age in ages), 1)
+  returns_hist = history.circular_history(returns, max(width, max_work))
+  infl_hist    = history.circular_history(inflation, width)
+  final_growth, unit_spent = mc_engine.decumulation_factors(
+    history.windows(returns_hist, retire_start, width),
+    history.windows(infl_hist, retire_start % len(inflation), width),
+    retire_duration)
+  total_spent = unit_spent[:, -1]
+  retired = retire_duration > 0
+
+  results = []
+  for age in ages:
+    work_years = RETIRE_AGE - age
+    work_path  = history.windows(returns_hist, work_start, max(work_years, 1))
+    growth, discount = mc_engine.accumulation_factors(work_path, work_years)
+    for saving in savings:
+      for withdrawal in withdrawals:
+        start_value, bankrupt, outcome = scenario_outcomes(
+          growth, discount, final_growth, total_spent, retired, saving,
+          withdrawal)
+        results.append({'Age': age,
+                        'Savings': int(saving),
+                        'Withdrawal': int(withdrawal),
+                        'Start value': int(np.mean(start_value)),
+                        'Odds': round(100 * float(np.mean(bankrupt)), 1),
+                        'Odds SE': round(100 * mc_stats.mean_error(bankrupt,
+                                                                   sampling), 2),
+                        'Min': int(np.min(outcome)),
+                        'Avg': int(np.mean(outcome)),
+                        'Max': int(np.max(outcome))})
+  return pd.DataFrame(results)
+
+
+def main():
+  returns   = history.load_returns('SP500_returns_1926-2023_pct.txt')
+  inflation = history.load_returns('annual_infl_rate_1926-2023_pct.txt')
+  exact = None
+  if EXACT:
+    exact = [exact_run(returns, inflation, saving) for saving in SAVINGS]
+  if exact is not None and None not in exact:
+    output_dt = interval_table(SAVINGS, exact)
+    print("Exact over every work start year and retirement start year and "
+          "duration\n")
+    print(output_dt.to_string())
+  elif ADAPTIVE:
+    output_dt = adaptive_sweep(returns, inflation, SAVINGS)
+    print(output_dt.to_string())
+  else:
+    scenarios = [(returns, inflation, saving) for saving in SAVINGS]
+    runs = sweep.parallel_sweep(montecarlo, scenarios, NUM_CASES,
+                                combine_chunks, seed=SEED, workers=WORKERS,
+                                common=COMMON)
+    results = []
+    for index, (saving, run) in enumerate(zip(SAVINGS, runs)):
+      odds = bankrupt_prob(run, saving)
+      # Error of the change in odds from the previous saving level, with common
+      # cases it comes from the cases where the two scenarios disagree
+      if index and COMMON:
+        change = (run['ruin year'] >= 0).astype(np.float64) - \
+                 (runs[index - 1]['ruin year'] >= 0)
+        odds['Change SE'] = round(100 * mc_stats.mean_error(change, SAMPLING),
+                                  2)
+      results.append(odds)
+    output_dt = pd.DataFrame(results)
+    print(output_dt)
+
+  # python pension_cal.py grid -- sweep ages, savings and withdrawals
+  if 'grid' in sys.argv[1:]:
+    grid = grid_sweep(returns, inflation, AGES, SAVINGS, WITHDRAWALS)
+    print(grid.sort_values('Odds').to_string(index=False))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,116 @@
+import numpy as np
+from scipy.signal import lfilter
+from scipy.signal import lfiltic
+
+try:
+  from numba import njit
+except ImportError:
+  njit = None
+
+# Stand-in for alpha + beta when they sum to one, the way getSigma2 did
+UNIT_PERSISTENCE = 0.9999999999999998
+
+
+def armaResiduals(c, phi, theta, r, gradient=False):
+  """
+  Residuals of ARMA(p, q) with intercept, same as computeEpsilon: the first
+  p residuals are returns less their mean, the rest follow
+  eps[t] = r[t] - c - sum(phi[i] * r[t-1-i]) - sum(theta[j] * eps[t-1-j])
+  with zero residuals before the series. The AR part is a sum of shifted
+  returns and the MA part runs as one IIR filter.
+  gradient -- also return (T x 1+p+q) Jacobian of residuals to c, phi, theta
+  """
+  r     = np.asarray(r, dtype=np.float64)
+  phi   = np.asarray(phi, dtype=np.float64)
+  theta = np.asarray(theta, dtype=np.float64)
+  T, p, q = len(r), len(phi), len(theta)
+  start = min(p, T)
+  ma    = np.concatenate([[1.0], theta])
+
+  eps = np.empty(T)
+  eps[:start] = r[:start] - np.mean(r)
+  ar_resid = r[start:] - c
+  for i in range(p):
+    ar_resid -= phi[i] * r[start - 1 - i:T - 1 - i]
+  zi = lfiltic([1.0], ma, eps[:start][::-1])
+  eps[start:], _ = lfilter([1.0], ma, ar_resid, zi=zi)
+  if not gradient:
+    return eps
+
+  # Derivatives are zero over the first p days and follow the same MA filter
+  # driven by minus the lagged regressors of every parameter
+  jac = np.zeros((T, 1 + p + q))
+  lagged = np.zeros((T - start, 1 + p + q))
+  lagged[:, 0] = -1.0
+  for i in range(p):
+    lagged[:, 1 + i] = -r[start - 1 - i:T - 1 - i]
+  for j in range(q):
+    shifted = np.concatenate([np.zeros(j + 1), eps])[start:T]
+    lagged[:, 1 + p + j] = -shifted
+  jac[start:] = lfilter([1.0], ma, lagged, axis=0)
+  return eps, jac
+
+def startVariance(omega, alpha, beta):
+  """Variance of the first day and its derivatives to omega, alpha, beta"""
+  persistence = alpha + beta
+  if (1 - alpha - beta) == 0:
+    return omega / (1 - UNIT_PERSISTENCE), \
+           np.array([1 / (1 - UNIT_PERSISTENCE), 0.0, 0.0])
+  scale = 1 / (1 - persistence)
+  return omega * scale, np.array([scale, omega * scale**2, omega * scale**2])
+
+def varianceFilter(omega, alpha, beta, sigma0, eps):
+  """sigma2[t] = omega + alpha * eps[t-1]**2 + beta * sigma2[t-1] as IIR filter"""
+  sigma2 = np.empty(len(eps))
+  if len(eps):
+    sigma2[0] = sigma0
+    drive = omega + alpha * eps[:-1] ** 2
+    sigma2[1:], _ = lfilter([1.0], [1.0, -beta], drive, zi=[beta * sigma0])
+  return sigma2
+
+def varianceLoop(omega, alpha, beta, sigma0, eps):
+  """Same recursion as varianceFilter as a plain loop for numba"""
+  sigma2 = np.empty(len(eps))
+  if len(eps):
+    sigma2[0] = sigma0
+  for t in range(1, len(eps)):
+    sigma2[t] = omega + alpha * eps[t - 1] ** 2 + beta * sigma2[t - 1]
+  return sigma2
+
+if njit is not None:
+  varianceLoop = njit(cache=True)(varianceLoop)
+
+def garchVariance(omega, alpha, beta, eps, eps_jac=None, gradient=False):
+  """
+  GARCH(1, 1) variance of residuals, same as getSigma2. Runs compiled when
+  numba is installed and as a SciPy filter otherwise.
+  eps_jac  -- Jacobian of residuals to ARMA parameters, if given the variance
+              Jacobian starts with columns of those parameters
+  gradient -- also return (T x k+3) Jacobian of variance to ARMA parameters
+              (k columns of eps_jac) and omega, alpha, beta
+  """
+  eps = np.asarray(eps, dtype=np.float64)
+  sigma0, start_grad = startVariance(omega, alpha, beta)
+  if njit is not None:
+    sigma2 = varianceLoop(omega, alpha, beta, sigma0, eps)
+  else:
+    sigma2 = varianceFilter(omega, alpha, beta, sigma0, eps)
+  if not gradient:
+    return sigma2
+
+  T = len(eps)
+  k = 0 if eps_jac is None else eps_jac.shape[1]
+  jac = np.zeros((T, k + 3))
+  if T == 0:
+    return sigma2, jac
+  # d sigma2[t] = drive[t-1] + beta * d sigma2[t-1], from d sigma2[0]
+  drive = np.zeros((T - 1, k + 3))
+  if k:
+    drive[:, :k] = 2 * alpha * eps[:-1, None] * eps_jac[:-1]
+  drive[:, k]     = 1.0
+  drive[:, k + 1] = eps[:-1] ** 2
+  drive[:, k + 2] = sigma2[:-1]
+  jac[0, k:] = start_grad
+  zi = (beta * jac[0])[None, :]
+  jac[1:], _ = lfilter([1.0], [1.0, -beta], drive, axis=0, zi=zi)
+  return sigma2, jac
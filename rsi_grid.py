@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from backtest import actionCodes
+from backtest import batchTrade
+from indicators import computeReturns
+from indicators import computeRsiList
+
+PRICES = None
+STAGES_PER_TASK = 10
+
+
+def initWorker(prices):
+  global PRICES
+  PRICES = prices
+
+def scoreRsi(stages, lowers, highers, min_trades, init, cost):
+  """
+  Score every (lower, higher, min trade) for a list of (burn in, RSI list)
+  stages in a single pass of the batch backtest. Actions depend on RSI and
+  (lower, higher) only, so they are taken once and shared by all min trades.
+  Returns rows of (lower, higher, min trade, cash) in grid order.
+  """
+  pairs   = list(product(lowers, highers))
+  codes   = np.concatenate([np.stack([actionCodes(rsi, lower, higher)
+                                      for lower, higher in pairs])
+                            for _, rsi in stages])
+  actions = np.repeat(codes, len(min_trades), axis=0)
+  block   = len(pairs) * len(min_trades)
+  entry   = np.repeat([burn_in for burn_in, _ in stages], block)
+  k       = np.tile(min_trades, len(pairs) * len(stages))
+  cash, _ = batchTrade(PRICES, actions, init, cost, entry, k)
+  lower   = np.tile(np.repeat([p[0] for p in pairs], len(min_trades)), len(stages))
+  higher  = np.tile(np.repeat([p[1] for p in pairs], len(min_trades)), len(stages))
+  return np.column_stack([lower, higher, k, cash])
+
+def gridSearch(dt, p_area, init, cost, workers=None):
+  """
+  Evaluate trainRsiModel over the whole grid of parameters. Returns and RSI
+  are computed once per (burn in, look back) and memoized. Trades of a few
+  RSI lists at a time are scored by the batch backtest as one task of a
+  process pool and results are written straight into preallocated columns of
+  the output DataFrame in grid order.
+  p_area  -- dict of lists with keys of trainRsiModel params: 'burn in',
+             'look back', 'lower', 'higher', 'min trade'
+  workers -- number of processes, None uses all cores, 1 runs in process
+  """
+  prices  = dt['Close'].tolist()
+  returns = computeReturns(prices)
+  lowers, highers, min_trades = p_area['lower'], p_area['higher'], p_area['min trade']
+  stages = list(product(p_area['burn in'], p_area['look back']))
+  block  = len(lowers) * len(highers) * len(min_trades)
+
+  columns = {'burn in': np.repeat([s[0] for s in stages], block),
+             'look back': np.repeat([s[1] for s in stages], block),
+             'lower': np.zeros(len(stages) * block, dtype=np.int64),
+             'higher': np.zeros(len(stages) * block, dtype=np.int64),
+             'min trade': np.zeros(len(stages) * block, dtype=np.int64),
+             'cash': np.zeros(len(stages) * block)}
+
+  rsi_memo = {}
+  def rsiStage(burn_in, look_back):
+    key = (burn_in, look_back)
+    if key not in rsi_memo:
+      rsi_memo[key] = computeRsiList(returns, burn_in, look_back)
+    return rsi_memo[key]
+
+  def store(first_stage, rows):
+    pos  = slice(first_stage * block, first_stage * block + len(rows))
+    columns['lower'][pos]     = rows[:, 0]
+    columns['higher'][pos]    = rows[:, 1]
+    columns['min trade'][pos] = rows[:, 2]
+    columns['cash'][pos]      = rows[:, 3]
+
+  # Every task scores a few RSI lists in one pass of the batch backtest
+  tasks = [(first, [(b, rsiStage(b, lb)) for b, lb in stages[first:first + STAGES_PER_TASK]])
+           for first in range(0, len(stages), STAGES_PER_TASK)]
+  if workers == 1:
+    initWorker(prices)
+    for first, task in tasks:
+      store(first, scoreRsi(task, lowers, highers, min_trades, init, cost))
+  else:
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWorker,
+                             initargs=(prices,)) as pool:
+      futures = {pool.submit(scoreRsi, task, lowers, highers, min_trades, init,
+                             cost): first
+                 for first, task in tasks}
+      for future in as_completed(futures):
+        store(futures[future], future.result())
+
+  return pd.DataFrame(columns)
@@ -1,6 +1,11 @@
 import numpy as np
 import pandas as pd
-import yfinance as yf
+import market_data
+from levels import findLevels
+from levels import levelIndex
+from levels import generateSignals
+from backtest import tradeLedger
+from backtest import codesFromActions
 import matplotlib.pyplot as plt
 from math import floor
 from datetime import date
@@ -16,7 +21,7 @@ import sys
 def readYfData(idx):
   start_date = datetime(2016, 1, 1)
   end_date   = date.today()
-  etf_df = yf.download(idx, start=start_date, end=end_date)
+  etf_df = market_data.read_history(idx, start_date, end_date)
   return etf_df
 
 def splitTrainTest(dt, k=0.8):
@@ -27,101 +32,25 @@ def splitTrainTest(dt, k=0.8):
   test  = test[split_point:]
   return train, test
 
-def findSupport(dt, l, n1, n2):
-  for i in range(l-n1+1, l+1):
-    if (dt['Low'][i] > dt['Low'][i-1]):
-      return 0
-  for i in range(i+1, l+n2+1):
-    if (dt['Low'][i] < dt['Low'][i-1]):
-      return 0
-  return 1
-
-def findResistance(dt, l, n1, n2):
-  for i in range(l-n1+1, l+1):
-    if (dt['High'][i] < dt['High'][i-1]):
-      return 0
-  for i in range(l+1, l+n2+1):
-    if (dt['High'][i] > dt['High'][i-1]):
-      return 0
-  return 1
-
-def findLevels(dt, n1, n2, dur):
-  sr_list = []
-  for row in range(n1, dur):
-    if findSupport(train, row, n1, n2):
-      sr_list.append((row, train['Low'][row], 'support'))
-    if findResistance(train, row, n1, n2):
-      sr_list.append((row, train['High'][row], 'resistance'))
-  res = pd.DataFrame(sr_list)
-  res.columns = ['idx', 'value', 'type']
-  return res
-
-def findLatest(dt, day):
-  tmp = dt.copy()
-  tmp = tmp[tmp['idx'] <= day]
-  support    = 0.0
-  resistance = 0.0
-  if ('support' in tmp['type'].unique().tolist()):
-    support = tmp[tmp['type'] == 'support']['value'].tolist()[-1]
-  if ('resistance' in tmp['type'].unique().tolist()):
-    resistance = tmp[tmp['type'] == 'resistance']['value'].tolist()[-1]
-  return {'support': support, 'resistance': resistance}
-
-def generateSignal(dt, sr, day):
-  close = dt['Close'][day]
-  result = {'day':day,
-            'support':sr['support'],
-            'resistance':sr['resistance'],
-            'price': close,
-            'action': 'hold'}
-  if close < sr['support']:
-    result['action']  = 'buy'
-  if close > sr['resistance']:
-    result['action'] = 'sell'
-  return result
-
 def sendSignal(dt, n1, n2, duration, burn_in):
-  errm1  = 'Day = {}, support = {:.4f}, resistance = {:.4f}, close = {:.4f}, signal = {}'
-  levels = findLevels(train, n1, n2, duration)
-  trade_sign = {'day':0,
-                'support': 0.0,
-                'resistance':0.0,
-                'price':0.0,
-                'action':'hold'}
-  result = []
-  for day in range(n1, duration):
-    sr_values = findLatest(levels, day)
-    if day >= burn_in:
-      trade_sign = generateSignal(dt, sr_values, day)
-    result.append(trade_sign)
-  result = pd.DataFrame(result)
+  levels = findLevels(dt, n1, n2, duration)
+  index  = levelIndex(levels, duration)
+  days   = np.arange(n1, duration)
+  result = generateSignals(dt['Close'].to_numpy(), index, days, burn_in)
   return result
 
 def tradingResults(dt, init_inv, days, trans_cost):
-  tmp = dt.copy()
-  tmp = tmp[['day', 'price', 'action']]
-  start = min(tmp['day'])
-  money    = init_inv
-  quantity = 0
-  transaction_cost = 0
-  for day in range(start, days):
-    action = dt[dt['day'] == day]['action'].tolist()[0]
-    price  = dt[dt['day'] == day]['price'].tolist()[0]
-    if (action == 'buy' and money > price):
-      affordable_qty = floor(money / price)
-      purchase = round(price * affordable_qty, 2)
-      money -= purchase
-      quantity += affordable_qty
-      transaction_cost += trans_cost
-    if (action == 'sell' and quantity > 0):
-      sell = round(price * quantity, 2)
-      quantity = 0
-      money =+ sell
-      transaction_cost += trans_cost
-    profit = money - init_inv - transaction_cost
-    margin = profit / init_inv
+  """
+  Trade signals from the first signal day up to days in one pass of the
+  trade ledger. Costs are summed aside and deducted from profit, stock left
+  at the end is not sold. Returns the ledger with fills.
+  """
+  tmp = dt[dt['day'] < days].sort_values('day')
+  ledger = tradeLedger(tmp['price'].to_numpy(), codesFromActions(tmp['action']),
+                       init_inv, trans_cost, cost_in_cash=False)
   errm = 'Investment = {}, profit = {:.2f}, margin = {:.2f}%'
-  print(errm.format(init_inv, profit, 100*margin)) 
+  print(errm.format(init_inv, ledger['profit'], 100*ledger['margin']))
+  return ledger
 
 
 #### ------------------------- Trading test -------------------------- ####
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+CHUNK_SIZE = 25000
+
+
+def split_cases(num_cases, chunk_size):
+  '''Split cases of a scenario into chunks of fixed size'''
+  num_cases = int(num_cases)
+  sizes = [chunk_size for _ in range(num_cases // chunk_size)]
+  if num_cases % chunk_size:
+    sizes.append(num_cases % chunk_size)
+  return sizes
+
+
+def run_chunk(func, args, num_cases, seed):
+  return func(*args, num_cases=num_cases, rng=np.random.default_rng(seed))
+
+
+def parallel_sweep(func, scenarios, num_cases, combine, seed=None,
+                   chunk_size=CHUNK_SIZE, workers=None, common=False):
+  '''
+  Run func(*args, num_cases=n, rng=generator) for every scenario in chunks of
+  cases spread across a process pool and join chunks of each scenario with
+  combine. Every chunk gets its own seed spawned from the master seed by
+  scenario and chunk number, so results depend on the master seed and chunk
+  size only and not on the number of workers. Returns combined results in
+  the order of scenarios.
+  With common every scenario gets the same chunk seeds and so the same cases
+  (common random numbers), which takes most of the sampling noise out of the
+  differences between scenarios.
+  '''
+  master = np.random.SeedSequence(seed)
+  sizes = split_cases(num_cases, chunk_size)
+  if common:
+    scenario_seeds = [master.spawn(len(sizes))] * len(scenarios)
+  else:
+    scenario_seeds = [s.spawn(len(sizes)) for s in master.spawn(len(scenarios))]
+  tasks = []
+  for scenario, chunk_seeds in enumerate(scenario_seeds):
+    for chunk, chunk_seed in enumerate(chunk_seeds):
+      tasks.append((scenario, chunk, sizes[chunk], chunk_seed))
+
+  results = [[None for _ in split_cases(num_cases, chunk_size)]
+             for _ in scenarios]
+  if workers == 1:
+    for scenario, chunk, size, chunk_seed in tasks:
+      results[scenario][chunk] = run_chunk(func, scenarios[scenario], size,
+                                           chunk_seed)
+  else:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      futures = {pool.submit(run_chunk, func, scenarios[scenario], size,
+                             chunk_seed): (scenario, chunk)
+                 for scenario, chunk, size, chunk_seed in tasks}
+      for future, (scenario, chunk) in futures.items():
+        results[scenario][chunk] = future.result()
+
+  return [combine(chunks) for chunks in results]
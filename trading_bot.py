@@ -1,11 +1,13 @@
 import ctypes
 import numpy as np
+import mc_engine
+import mc_stats
+import indicators
 import pandas as pd
-import yfinance as yf
+import market_data
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
-import random
 import time
 import sys
 
@@ -16,6 +18,11 @@ START_VALUE  = 1000
 MIN_HOLD     = 60
 MAX_HOLD     = 365
 CUT_OFF_DATE = date(2024, 4, 13)
+TRUNCATE     = False # Cut value to whole units daily as legacy loop did
+RISK_LEVEL   = 0.95  # Confidence of earnings at risk
+OUTCOME_RANGE = 4    # Outcomes up to this multiple of start value are binned
+ODDS_WIDTH   = 0.005 # Stop when ruin odds are known within this either side
+MEAN_WIDTH   = 0.005 # Same for mean outcome, relative to the mean
 
 def message_box(title, text, style):
   return ctypes.windll.user32.MessageBoxW(0, text, title, style)
@@ -30,13 +37,7 @@ def compute_returns(prices):
 
 
 def compute_rsi(returns):
-  up_close   = len(list(filter(lambda x: (x > 0), returns)))
-  down_close = len(list(filter(lambda x: (x < 0), returns)))
-  if down_close == 0:
-    down_close = 1
-  rs_val = round(up_close / down_close, 2)
-  rsi    = round(100 - (100 / (1 + rs_val)), 2)
-  return rsi
+  return indicators.computeRsi(returns)
 
 
 def take_action(rsi):
@@ -56,48 +57,36 @@ def compute_median_hold(cut_off_date):
   return median_hold.days
   
 
-def montecarlo(returns, median_hold):
-  case_count = 0
-  bankrupt_count = 0
-  outcome = []
-  while case_count < int(NUM_CASES):
-    investments = START_VALUE
-    start_day = random.randrange(0, len(returns))
-    duration  = int(random.triangular(MIN_HOLD, MAX_HOLD, int(median_hold)))
-    end_day   = start_day + duration
-    lifespan  = [i for i in range(start_day, end_day)]
-    bankrupt  = 'no'
-    lifespan_returns = []
-    for i in lifespan:
-      lifespan_returns.append(returns[i % len(returns)])
-    for index, i in enumerate(lifespan_returns):
-      investments = int(investments * (1 + i))
-    if investments < START_VALUE:
-      bankrupt = 'yes'
-      bankrupt_count += 1
-    outcome.append(investments)
-    case_count += 1
-  return outcome, bankrupt_count
-
-
-def bankrupt_prob(outcome, bankrupt_count, median_hold, action):
-  total = len(outcome)
-  odds  = round(100 * bankrupt_count / total, 1)
-  min_out = min(i for i in outcome)
-  avg_out = int(sum(outcome) / total)
-  max_out = max(i for i in outcome)
-  reverse_outcome = [i - START_VALUE for i in outcome]
-  reverse_outcome = [-1 * i for i in reverse_outcome]
-  reverse_outcome.sort()
-  q95 = int(NUM_CASES * 0.95)
-  loss = reverse_outcome[q95]
+def montecarlo(returns, median_hold, truncate=TRUNCATE):
+  return mc_engine.hold_stats(returns, START_VALUE, MIN_HOLD, MAX_HOLD,
+                              int(median_hold), NUM_CASES, OUTCOME_RANGE,
+                              truncate, ODDS_WIDTH, MEAN_WIDTH)
+
+
+def bankrupt_prob(stats, median_hold, action):
+  result = mc_stats.summary(stats)
+  odds = result['odds']
+  min_out = int(result['min'])
+  avg_out = int(result['mean'])
+  max_out = int(result['max'])
+  loss = START_VALUE - int(mc_stats.quantile(stats, 1 - RISK_LEVEL))
+  tail_loss = START_VALUE - int(mc_stats.tail_mean(stats, 1 - RISK_LEVEL))
+  odds_low, odds_high = mc_stats.wilson_interval(stats)
   print("\nInitial investments = ${:,}".format(START_VALUE))
   print("Days hold (min-med-max): {}-{}-{}\n".format(MIN_HOLD, median_hold, MAX_HOLD))
-  print("Odds of ruin: {}%".format(odds))
+  if stats['exact']:
+    print("Number of runs: {:,} (every start day and duration)".format(
+      int(result['count'])))
+    print("Odds of ruin: {}% (exact)".format(odds))
+  else:
+    print("Number of runs: {:,}".format(result['count']))
+    print("Odds of ruin: {}% (95% interval {:.1f}-{:.1f}%)".format(
+      odds, 100 * odds_low, 100 * odds_high))
   print("Min outcome: ${:,}".format(min_out))
   print("Avg outcome: ${:,}".format(avg_out))
   print("Max outcome: ${:,}".format(max_out))
   print("Earnings at risk: ${:,}".format(loss))
+  print("Expected loss beyond it: ${:,}".format(tail_loss))
   print("Action: {}".format(action))
   
   m1 = "\nInitial investments = " + str(START_VALUE)
@@ -111,7 +100,7 @@ def bankrupt_prob(outcome, bankrupt_count, median_hold, action):
 def read_etf_data(etf):
   start_date = datetime(2016, 1, 1)
   end_date   = date.today()
-  etf_df = yf.download(etf, start=start_date, end=end_date)
+  etf_df = market_data.read_history(etf, start_date, end_date)
   return etf_df
 
 def main():
@@ -121,8 +110,8 @@ def main():
   action  = take_action(rsi)
 
   median_hold = compute_median_hold(CUT_OFF_DATE)
-  outcome, bankrupt_count = montecarlo(returns, median_hold)
-  odds = bankrupt_prob(outcome, bankrupt_count, median_hold, action)
+  stats = montecarlo(returns, median_hold)
+  odds = bankrupt_prob(stats, median_hold, action)
   message_box('Trading bot', odds, 1)
 
 
@@ -0,0 +1,122 @@
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from garch_model import selectOrder
+from garch_model import trainArma
+from garch_model import trainGarch
+from garch_model import garchModel
+
+SELECT_EVERY = 20   # Steps between searches of ARMA order
+REFIT_EVERY  = 5    # Steps between warm started refits of ARMA and GARCH
+DRIFT_LIMIT  = 0.5  # Drop of mean log-likelihood per day that forces a search
+DRIFT_WINDOW = 10   # Number of latest days checked for the drift
+
+
+def startWalk(max_p, max_q, select_every=SELECT_EVERY, refit_every=REFIT_EVERY,
+              drift_limit=DRIFT_LIMIT, drift_window=DRIFT_WINDOW, workers=None,
+              prune_margin=None):
+  """
+  State of a walk forward ARMA-GARCH model over windows that move by one
+  day per step. select_every=1 and refit_every=1 fit every step as before.
+  workers and prune_margin are passed to selectOrder.
+  Drift is judged on days filtered between refits, so drift_window must fit
+  in those of one select_every period, unless drift_window is None. Drift is
+  not checked when no day is filtered between searches.
+  """
+  filtered = (select_every - 1) - (select_every - 1) // refit_every
+  if filtered == 0:
+    drift_window = None
+  if drift_window is not None and drift_window > filtered:
+    raise ValueError('Drift window of {} days is longer than {} days filtered '
+                     'between searches'.format(drift_window, filtered))
+  return {'max p': max_p,
+          'max q': max_q,
+          'select every': select_every,
+          'refit every': refit_every,
+          'drift limit': drift_limit,
+          'drift window': drift_window,
+          'workers': workers,
+          'prune margin': prune_margin,
+          'order': None,
+          'orders': None,
+          'starts': {},
+          'arma': None,
+          'resids': None,
+          'garch params': None,
+          'base llf': None,
+          'recent llf': [],
+          'since select': 0,
+          'since refit': 0,
+          'selects': 0,
+          'refits': 0}
+
+def driftDetected(walk):
+  """True if the latest days fit much worse than the window of the last fit"""
+  if walk['drift window'] is None:
+    return False
+  recent = walk['recent llf'][-walk['drift window']:]
+  if walk['base llf'] is None or len(recent) < walk['drift window']:
+    return False
+  return np.mean(recent) < walk['base llf'] - walk['drift limit']
+
+def stepWalk(walk, training):
+  """
+  Move the model to a window one day later than the previous call. The order
+  is searched on the first step, every select_every steps and on drift of
+  likelihood, with every order warm started from its last fit. ARMA and GARCH
+  are refitted every refit_every steps starting from their last parameters.
+  Between refits ARMA filter takes only the new day with fixed parameters, its
+  residual replaces the oldest one, and GARCH is evaluated with fixed
+  parameters on the scaled residuals.
+  Returns dict of 'order', 'arma', 'resids', 'scaler', 'garch' and flags
+  'select' and 'refit' of what was done on this step.
+  """
+  training = np.asarray(training, dtype=np.float64)
+  select = walk['order'] is None or driftDetected(walk) or \
+           walk['since select'] >= walk['select every']
+  if select:
+    p, q, table = selectOrder(training, walk['max p'], walk['max q'],
+                              walk['starts'], walk['workers'],
+                              walk['prune margin'])
+    walk['starts'] = dict(zip(zip(table['p'], table['q']), table['params']))
+    walk['orders'] = table
+    if (p, q) != walk['order']:
+      walk['arma'] = None
+    walk['order'] = (p, q)
+    walk['recent llf'] = []
+    walk['since select'] = 0
+    walk['selects'] += 1
+  p, q = walk['order']
+
+  refit = select or walk['since refit'] >= walk['refit every']
+  if refit:
+    start = None if walk['arma'] is None else walk['arma'].params
+    arima_result, arima_resids = trainArma(training, p, q, start)
+    # Days filtered since the last search stay in the drift window, only the
+    # baseline moves to the new fit
+    walk['base llf']   = arima_result.llf / len(training)
+    walk['since refit'] = 0
+    walk['refits'] += 1
+  else:
+    arima_result = walk['arma'].extend(training[-1:])
+    arima_resids = np.append(walk['resids'][1:], arima_result.resid)
+    walk['recent llf'].append(float(arima_result.llf_obs[-1]))
+
+  scaler = StandardScaler()
+  scaled_training = scaler.fit_transform(np.array(arima_resids).reshape(-1, 1))
+  if refit:
+    gjr = trainGarch(scaled_training, walk['garch params'])
+    walk['garch params'] = gjr.params.values
+  else:
+    gjr = garchModel(scaled_training).fix(walk['garch params'])
+
+  walk['arma']   = arima_result
+  walk['resids'] = arima_resids
+  walk['since select'] += 1
+  walk['since refit']  += 1
+  return {'order': (p, q),
+          'arma': arima_result,
+          'resids': arima_resids,
+          'scaler': scaler,
+          'garch': gjr,
+          'select': select,
+          'refit': refit}
@@ -10,7 +10,7 @@ Original file is located at
 import random
 import numpy as np
 import pandas as pd
-import yfinance as yf
+import market_data
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
 
@@ -39,13 +39,17 @@ from datetime import datetime
 from itertools import product
 from itertools import groupby
 
+from garch_forecast import forecastChunks
+from garch_forecast import forecastScores
+from outliers import removeOutliers
+
 !pip install arch
 from arch import arch_model
 
 def readYfData(idx):
   start_date = datetime(2016, 1, 1)
   end_date   = date.today()
-  etf_df = yf.download(idx, start=start_date, end=end_date)
+  etf_df = market_data.read_history(idx, start_date, end_date)
   return etf_df
 
 def computeReturns(prices):
@@ -55,42 +59,6 @@ def computeReturns(prices):
   returns = [0.00000] + returns
   return returns
 
-def computeRsi(returns):
-  up_close   = len(list(filter(lambda x: (x > 0), returns)))
-  down_close = len(list(filter(lambda x: (x < 0), returns)))
-  if down_close == 0:
-    down_close = 1
-  rs_val = round(up_close / down_close, 2)
-  rsi    = round(100 - (100 / (1 + rs_val)), 2)
-  return rsi
-
-def computeRsiList(returns, burn_in, look_back):
-  rsi = []
-  first_rsi = 0.0
-  for day in range(burn_in, len(returns)):
-    ytd_returns = returns[0:day]
-    day_rsi = computeRsi(ytd_returns[len(ytd_returns) - look_back:len(ytd_returns)])
-    rsi.append(day_rsi)
-    if day == burn_in:
-      first_rsi == day_rsi
-  if first_rsi >= 80:
-    first_rsi = 50
-  elif first_rsi <= 20:
-    first_rsi = 50
-  prefix_rsi = [first_rsi for x in range(burn_in)]
-  res = prefix_rsi + rsi
-  return res
-
-def removeOutliers(returns, sigma_limit):
-  scaler = StandardScaler()
-  scaled_log_returns = scaler.fit_transform(np.array(returns).reshape(-1, 1))
-  scaled_outliers = [i for i, x in enumerate(scaled_log_returns)\
-                     if abs(x) > sigma_limit]
-  rep = np.median(returns)
-  log_returns = [rep if i in scaled_outliers else x for\
-                 i, x in enumerate(returns)]
-  return log_returns
-
 def computeAcfValue(diffs, n_lags):
   acf_res = pd.DataFrame(acf(pd.Series(diffs), nlags=n_lags))
   acf_res.columns = ['value']
@@ -198,10 +166,12 @@ LOOK_BACK   = 1000        # Number of days to look back when building a model
 LOOK_AHEAD  =    7        # Number of days to forecast ahead
 BURN_IN     =   30        # Burn in period to allow RSI to stabilize
 OUTLIER_SIG =  3.3        # Outlier sigma to cut-off outliers
+OUTLIER_WIN = None        # Days of causal outlier stats, None uses all days
 INITIAL_INV = 1000        # Initial investment amount
 TRANS_COST  =    8        # Cost per one transaction
 IDLE_COST   =  120        # Cost if now transactions in 365 days
 MIN_PURCHAS =   10        # Minimal number of stocks to buy in a batch
+WORKERS     = None        # Processes of GARCH forecasts, None uses all cores
 
 prices      = iuit_l['Close'].tolist()
 log_prices  = np.log(prices).tolist()
@@ -211,7 +181,7 @@ price_trend = pd.Series(prices).rolling(100).mean()
 # We use standardized log returns to detect outliers since other methods like
 # IQR are too sensitive to outliers and identify too many of them in the series
 # which might lead to loosing some valuable information.
-returns = removeOutliers(returns, OUTLIER_SIG)
+returns = removeOutliers(returns, OUTLIER_SIG, window=OUTLIER_WIN)
 n_steps  = len(returns) - (ENTRY_IDX + LOOK_AHEAD)
 last_idx = len(returns) + 1 - LOOK_AHEAD
 
@@ -221,31 +191,19 @@ last_idx = len(returns) + 1 - LOOK_AHEAD
 plt.plot(returns, color='lightgrey')
 plt.show()
 
-steps = 0
-testing_history  = []
-forecast_history = []
-result_history   = []
-
-for step in range(ENTRY_IDX, last_idx):
-  window_start = step - LOOK_BACK
-  window_end   = step + LOOK_AHEAD
-  window_rets = returns[window_start:window_end]
-  training = window_rets[:LOOK_BACK]
-  testing  = window_rets[LOOK_BACK:]
-  preds, result = predictArch(training, testing)
-  result['step'] = step
-  result_history.append(result)
-  testing_history.extend(testing)
-  forecast_history.extend(preds)
-  steps += 1
-  #if steps == 100:
-  #  break
+# Windows move by one day, so every GARCH fit starts from the previous one and
+# the scaler moments slide with the window. Chunks of steps run in parallel.
+forecast = forecastChunks(returns, ENTRY_IDX, last_idx, LOOK_BACK, LOOK_AHEAD,
+                          workers=WORKERS)
+testing_history  = forecast['testing'].ravel().tolist()
+forecast_history = forecast['forecast'].ravel().tolist()
+steps = len(forecast['step'])
 
 plt.plot(testing_history, color='lightgrey')
 plt.plot(forecast_history, color='green')
 plt.show()
 
-results = pd.DataFrame(result_history)
+results = pd.DataFrame(forecastScores(forecast))
 results.head()
 
 plt.plot(results['mae naive'], color='lightgrey')